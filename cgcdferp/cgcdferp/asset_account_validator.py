@@ -1,7 +1,13 @@
+import hashlib
+
 import frappe 
 from frappe import _
+from frappe.model.document import Document
 from frappe.utils import flt, cstr
 
+from cgcdferp.cgcdferp.budget_profiler import mark_error, note_matches, profile_check, span
+from cgcdferp.cgcdferp.doctype.capital_budget_settings.capital_budget_settings import get_enforcement_mode
+
 ACCOUNT_FIELD_MAP = {
     "Purchase Order": ("items", ["custom_fixed_asset_amount", "expense_account"]),
     "Purchase Invoice": ("items", ["custom_fixed_asset_amount", "expense_account"]),
@@ -16,6 +22,12 @@ ACCOUNT_FIELD_MAP = {
     "Payroll Entry": ("accounts", ["payable_account"]),
 }
 
+UTILIZATION_DOCTYPE = "Capital Budget Utilization"
+BUDGET_INDEX_CACHE_KEY = "capital_budget_index"
+BUDGETED_ACCOUNTS_CACHE_KEY = "capital_budget_accounts"
+HEADROOM_CACHE_KEY = "capital_budget_headroom"
+HEADROOM_TTL = 30
+
 def _row_get(row, field):
     try:
         if hasattr(row, field):
@@ -42,6 +54,32 @@ def _company_currency(company):
         cur = frappe.db.get_value("Company", company, "default_currency")
     return cur
 
+def get_item_attributes(item_codes):
+    """item_name, is_fixed_asset and custom_asset_account for `item_codes`, loaded in one query
+
+    Results are kept for the rest of the request. Unknown item codes are left out of the
+    returned dict.
+    """
+    local_cache = getattr(frappe.local, "capital_budget_item_attributes", None)
+    if local_cache is None:
+        local_cache = frappe.local.capital_budget_item_attributes = {}
+
+    missing = {cstr(code) for code in item_codes if code} - set(local_cache)
+    if missing:
+        fields = ["name", "item_name", "is_fixed_asset"]
+        if frappe.get_meta("Item").has_field("custom_asset_account"):
+            fields.append("custom_asset_account")
+
+        found = frappe.get_all("Item", filters={"name": ["in", list(missing)]}, fields=fields)
+        for item in found:
+            item.setdefault("custom_asset_account", None)
+            local_cache[item.name] = item
+
+        for item_code in missing - {item.name for item in found}:
+            local_cache[item_code] = None
+
+    return {code: local_cache[code] for code in item_codes if code and local_cache.get(code)}
+
 def match_budget_dimensions(transaction_dims, budget_against, budget_against_value, budget_department):
     """Match transaction dimensions with budget dimensions
     
@@ -81,7 +119,7 @@ def match_budget_dimensions(transaction_dims, budget_against, budget_against_val
     
     return True, primary_score + dept_score
 
-def find_matching_budget(account, transaction_dims, budget_map):
+def find_matching_budget(account, transaction_dims, budget_index):
     """Find best matching Capital Budget entry"""
     best_match = None
     best_score = 0
@@ -89,106 +127,130 @@ def find_matching_budget(account, transaction_dims, budget_map):
     # Debug logging
     matches_found = []
     
-    for key, budget_info in budget_map.items():
-        budget_account, budget_against, budget_against_value, budget_department = key.split("|")
-        if budget_account != account:
-            continue
-        
+    for budget_info in budget_index.get(account, ()):
         matched, score = match_budget_dimensions(
             transaction_dims, 
-            budget_against, 
-            budget_against_value, 
-            budget_department
+            budget_info["budget_against"], 
+            budget_info["budget_against_value"], 
+            budget_info["department"]
         )
         
         if matched:
             matches_found.append({
-                "key": key,
+                "key": budget_info["key"],
                 "score": score,
-                "budget_against": budget_against,
-                "budget_against_value": budget_against_value,
-                "department": budget_department,
+                "budget_against": budget_info["budget_against"],
+                "budget_against_value": budget_info["budget_against_value"],
+                "department": budget_info["department"],
                 "amount": budget_info["amount"]
             })
             
             if score > best_score:
-                best_match = key
+                best_match = budget_info
                 best_score = score
     
-    # Debug: Log all matches (commented out for production, uncomment for debugging)
-    # if matches_found:
-    #     frappe.log_error(
-    #         title="Budget Matching Debug",
-    #         message=f"Account: {account}\n"
-    #                f"Transaction Dims: {transaction_dims}\n"
-    #                f"Matches Found: {len(matches_found)}\n"
-    #                f"Details: {frappe.as_json(matches_found, indent=2)}\n"
-    #                f"Best Match: {best_match} (Score: {best_score})"
-    #     )
+    if matches_found:
+        note_matches(account, transaction_dims, matches_found)
     
     if best_match:
-        return best_match, budget_map[best_match]
+        return best_match["key"], best_match
     
     return None, None
 
+def _first_non_empty(columns):
+    """SQL for the first non-blank of `columns`, mirroring `row.get(a) or row.get(b)`"""
+    if not columns:
+        return "null"
+    return "coalesce({})".format(", ".join(f"nullif(trim({c}), '')" for c in columns))
+
+def _account_transactions_query(dt):
+    """Grouped query summing a doctype's submitted rows per effective account and dimensions"""
+    child_table, account_fields = ACCOUNT_FIELD_MAP[dt]
+    meta = frappe.get_meta(dt)
+    child_df = meta.get_field(child_table)
+    if not child_df:
+        return None
+
+    child_meta = frappe.get_meta(child_df.options)
+    if not (child_meta.has_field("item_code") and child_meta.has_field("amount")):
+        # rows without an item code or amount are never counted
+        return None
+
+    asset_fields = [
+        f"child.{f}" for f in ("custom_fixed_asset_amount", "fixed_asset_account") if child_meta.has_field(f)
+    ]
+    expense_fields = [f"child.{f}" for f in account_fields if child_meta.has_field(f)]
+    if not (asset_fields or expense_fields):
+        return None
+
+    account_expr = f"""case when ifnull(item.is_fixed_asset, 0) = 1
+        then {_first_non_empty(asset_fields)} else {_first_non_empty(expense_fields)} end"""
+
+    dimension_exprs = []
+    for dim in ("cost_center", "project", "department"):
+        columns = []
+        if child_meta.has_field(dim):
+            columns.append(f"child.{dim}")
+        if meta.has_field(dim):
+            columns.append(f"parent.{dim}")
+        dimension_exprs.append(f"{_first_non_empty(columns)} as row_{dim}")
+
+    return f"""
+        select
+            {", ".join(dimension_exprs)},
+            sum(child.amount) as amount
+        from `tab{child_df.options}` child
+        inner join `tab{dt}` parent
+            on parent.name = child.parent and child.parenttype = %(doctype)s and child.parentfield = %(child_table)s
+        left join `tabItem` item on item.name = child.item_code
+        where
+            parent.company = %(company)s
+            and parent.docstatus = 1
+            and parent.name != %(current_doc_name)s
+            and ifnull(child.item_code, '') != ''
+            and child.amount > 0
+            and %(account)s in ({", ".join(asset_fields + expense_fields)})
+            and {account_expr} = %(account)s
+        group by row_cost_center, row_project, row_department
+    """
+
+def _account_transactions_values(dt, account, company, current_doc_name=None):
+    return {
+        "doctype": dt,
+        "child_table": ACCOUNT_FIELD_MAP[dt][0],
+        "company": company,
+        "current_doc_name": current_doc_name or "",
+        "account": account,
+    }
+
 def get_existing_account_transactions(account, company, current_doc_name, doctype):
-    """Get existing transactions for this account"""
+    """Get existing transactions for this account, summed per cost center, project and department"""
     all_transactions = []
     doc_types_to_check = [doctype]
     
     for dt in doc_types_to_check:
         try:
-            filters = {"company": company, "docstatus": 1}
-            if current_doc_name and dt == doctype:
-                filters["name"] = ["!=", current_doc_name]
-
-            existing_docs = frappe.get_all(dt, filters=filters, fields=["name"], limit_page_length=1000)
-            if not existing_docs:
+            query = _account_transactions_query(dt)
+            if not query:
                 continue
 
-            child_table, account_fields = ACCOUNT_FIELD_MAP[dt]
-            
-            for doc_ref in existing_docs:
-                doc = frappe.get_doc(dt, doc_ref.name)
-                rows = doc.get(child_table, []) or []
-
-                for row in rows:
-                    row_amount = flt(_row_get(row, "amount") or 0)
-                    if row_amount <= 0:
-                        continue
-
-                    row_account = None
-                    item_code = _row_get(row, "item_code")
-                    if item_code:
-                        item = frappe.db.get_value("Item", item_code, ["is_fixed_asset"], as_dict=True)
-                        is_asset = bool(item.get("is_fixed_asset") if item else False)
-                        if is_asset:
-                            val = _row_get(row, "custom_fixed_asset_amount") or _row_get(row, "fixed_asset_account")
-                            if val:
-                                row_account = cstr(val).strip()
-                        else:
-                            for f in account_fields:
-                                val = _row_get(row, f)
-                                if val:
-                                    row_account = cstr(val).strip()
-                                    break
-
-                    if row_account != account:
-                        continue
-
-                    dims = {
-                        "cost_center": _row_get(row, "cost_center") or _doc_get(doc, "cost_center"),
-                        "project": _row_get(row, "project") or _doc_get(doc, "project"),
-                        "department": _row_get(row, "department") or _doc_get(doc, "department"),
-                    }
+            rows = frappe.db.sql(
+                query,
+                _account_transactions_values(dt, account, company, current_doc_name if dt == doctype else None),
+                as_dict=True,
+            )
 
-                    all_transactions.append({
-                        "doc_type": dt,
-                        "doc_name": doc_ref.name,
-                        "amount": row_amount,
-                        "dimensions": dims,
-                        "account": row_account
-                    })
+            for row in rows:
+                all_transactions.append({
+                    "doc_type": dt,
+                    "amount": flt(row.amount),
+                    "dimensions": {
+                        "cost_center": row.row_cost_center,
+                        "project": row.row_project,
+                        "department": row.row_department,
+                    },
+                    "account": account
+                })
 
         except Exception as e:
             frappe.log_error(f"Error processing {dt}: {str(e)}", "Budget Validator")
@@ -196,22 +258,12 @@ def get_existing_account_transactions(account, company, current_doc_name, doctyp
 
     return all_transactions
 
-def calculate_budget_utilization(account, budget_key, budget_info, company, current_doc_name, doctype):
+def calculate_budget_utilization(
+    account, budget_key, budget_info, company, current_doc_name, doctype, get_allocated=None
+):
     """Calculate budget utilization for a specific budget entry"""
-    existing_transactions = get_existing_account_transactions(account, company, current_doc_name, doctype)
-    _, budget_against, budget_against_value, budget_department = budget_key.split("|")
-    
-    allocated_amount = 0.0
-    for transaction in existing_transactions:
-        matched, _ = match_budget_dimensions(
-            transaction["dimensions"],
-            budget_against,
-            budget_against_value,
-            budget_department
-        )
-        if matched:
-            allocated_amount += transaction["amount"]
-    
+    allocated_amount = (get_allocated or get_budget_utilization)(account, budget_key, budget_info, doctype)
+
     budgeted_amount = budget_info["amount"]
     available_amount = budgeted_amount - allocated_amount
     
@@ -222,175 +274,737 @@ def calculate_budget_utilization(account, budget_key, budget_info, company, curr
         "budget_info": budget_info
     }
 
-def show_budget_summary(account_budget_summary, currency, doctype):
-    """Show summary after successful validation"""
-    if not account_budget_summary:
+def get_budget_lines_query(company, exclude_budget=None):
+    """Query and values for the submitted Capital Budget lines of a company"""
+    return (
+        """
+        select
+            ba.account, ba.budget_amount, cb.name as budget_name, cb.budget_against,
+            ifnull(cb.budget_against_value, '') as budget_against_value,
+            ifnull(cb.department, '') as department
+        from `tabCapital Budget` cb
+        inner join `tabBudget Account` ba
+            on ba.parent = cb.name and ba.parenttype = 'Capital Budget'
+        where cb.company = %(company)s and cb.docstatus = 1 and cb.name != %(exclude_budget)s
+        order by cb.modified desc, ba.idx
+        """,
+        {"company": company, "exclude_budget": exclude_budget or ""},
+    )
+
+def _build_budget_index(company, exclude_budget=None):
+    budget_lines = frappe.db.sql(*get_budget_lines_query(company, exclude_budget), as_dict=True)
+
+    budget_index = {}
+    entries = {}
+    for line in budget_lines:
+        account = cstr(line.account).strip()
+        if not account:
+            continue
+
+        dimension_key = f"{line.budget_against}|{line.budget_against_value}|{line.department}"
+        key = f"{account}|{dimension_key}"
+        if key not in entries:
+            entries[key] = {
+                "key": key,
+                "amount": 0.0,
+                "budget_against": line.budget_against,
+                "budget_against_value": line.budget_against_value,
+                "department": line.department,
+                "budget_name": line.budget_name,
+                "company": company,
+            }
+            budget_index.setdefault(account, []).append(entries[key])
+        entries[key]["amount"] += flt(line.budget_amount)
+
+    return budget_index
+
+def get_budget_index(company):
+    """Submitted Capital Budget lines of a company: account -> [budget line]"""
+    budget_index = frappe.cache.hget(BUDGET_INDEX_CACHE_KEY, company)
+    if budget_index is None:
+        budget_index = _build_budget_index(company)
+        frappe.cache.hset(BUDGET_INDEX_CACHE_KEY, company, budget_index)
+    return budget_index
+
+def get_budgeted_accounts(company):
+    """Accounts with a submitted Capital Budget line in `company`, for a cheap early exit"""
+    accounts = frappe.cache.hget(BUDGETED_ACCOUNTS_CACHE_KEY, company)
+    if accounts is None:
+        accounts = set(get_budget_index(company))
+        frappe.cache.hset(BUDGETED_ACCOUNTS_CACHE_KEY, company, accounts)
+    return accounts
+
+def may_match_budget(doc, budgeted_accounts):
+    """False when no row of `doc` names a budgeted account, so item lookups can be skipped"""
+    if doc.doctype not in ACCOUNT_FIELD_MAP:
+        return False
+
+    child_table, account_fields = ACCOUNT_FIELD_MAP[doc.doctype]
+    fields = list(account_fields) + ["custom_fixed_asset_amount", "fixed_asset_account"]
+    for row in doc.get(child_table, []) or []:
+        for f in fields:
+            val = _row_get(row, f)
+            if val and cstr(val).strip() in budgeted_accounts:
+                return True
+    return False
+
+def _delete_budget_index(company=None):
+    if company:
+        frappe.cache.hdel(BUDGET_INDEX_CACHE_KEY, company)
+        frappe.cache.hdel(BUDGETED_ACCOUNTS_CACHE_KEY, company)
+    else:
+        frappe.cache.delete_key(BUDGET_INDEX_CACHE_KEY)
+        frappe.cache.delete_key(BUDGETED_ACCOUNTS_CACHE_KEY)
+
+def clear_budget_index(company=None):
+    """Drop the cached budget index now and again once the transaction commits
+
+    A concurrent request can rebuild the index from the not yet committed state in between,
+    and the cache has no expiry, so the second delete is what makes the change visible.
+    """
+    _delete_budget_index(company)
+    frappe.db.after_commit.add(lambda: _delete_budget_index(company))
+
+def iter_matching_budgets(account, dims, budget_index):
+    """Every budget line of `account` whose dimensions cover `dims`"""
+    for budget_info in budget_index.get(account, ()):
+        matched, _ = match_budget_dimensions(
+            dims,
+            budget_info["budget_against"],
+            budget_info["budget_against_value"],
+            budget_info["department"]
+        )
+        if matched:
+            yield budget_info
+
+def get_row_account(row, account_fields, is_fixed_asset):
+    """Account a submitted row is booked against, as counted towards utilization"""
+    if is_fixed_asset:
+        val = _row_get(row, "custom_fixed_asset_amount") or _row_get(row, "fixed_asset_account")
+        return cstr(val).strip() if val else None
+
+    for f in account_fields:
+        val = _row_get(row, f)
+        if val:
+            return cstr(val).strip()
+    return None
+
+def get_row_dimensions(row, doc):
+    return {
+        "cost_center": _row_get(row, "cost_center") or _doc_get(doc, "cost_center"),
+        "project": _row_get(row, "project") or _doc_get(doc, "project"),
+        "department": _row_get(row, "department") or _doc_get(doc, "department"),
+    }
+
+def _utilization_name(budget_info, account, dimension_key, voucher_type):
+    # not keyed by budget name, so a new or amended budget on the same line keeps the running total
+    key = f"{budget_info['company']}|{account}|{dimension_key}|{voucher_type}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+def _dimension_key(budget_key):
+    return budget_key.split("|", 1)[1]
+
+def get_utilization_query(name, for_update=False):
+    """Query and values reading one utilization row, optionally locking it"""
+    lock = " for update" if for_update else ""
+    return f"select amount from `tab{UTILIZATION_DOCTYPE}` where name = %s{lock}", (name,)
+
+def _read_utilization(name, for_update=False):
+    rows = frappe.db.sql(*get_utilization_query(name, for_update))
+    return flt(rows[0][0]) if rows else 0.0
+
+def get_budget_utilization(account, budget_key, budget_info, voucher_type):
+    """Amount already consumed on a budget line by submitted `voucher_type` documents"""
+    return _read_utilization(_utilization_name(budget_info, account, _dimension_key(budget_key), voucher_type))
+
+def lock_budget_utilization(doc, account_requests, budget_index, company):
+    """Lock the utilization rows a document will be checked against and will post to
+
+    Each row is created if missing and then read with `SELECT ... FOR UPDATE`. The lock is held
+    until the submit transaction ends, so a concurrent submit against the same budget line waits
+    for this one to post its utilization instead of checking against a stale total. The best
+    match of each account and every line `post_budget_utilization` will later add to (wildcard
+    and department lines included) are locked together in key order, so on_submit takes no new
+    locks and two documents sharing several lines cannot deadlock.
+    Returns a `get_allocated` callable for `evaluate_budget` that reads the locked amounts.
+    """
+    voucher_type = doc.doctype
+    lines = {key: posting["budget_info"] for key, posting in get_budget_postings(doc, budget_index).items()}
+    account_groups = {}
+    for req in account_requests:
+        account_groups.setdefault(req["account"], req["dims"])
+    for acct, dims in account_groups.items():
+        budget_key, budget_info = find_matching_budget(acct, dims, budget_index)
+        if budget_key:
+            lines[budget_key] = budget_info
+
+    locked = {}
+    for budget_key in sorted(lines):
+        budget_info = lines[budget_key]
+        update_budget_utilization(
+            {budget_key: {"budget_info": budget_info, "amount": 0.0}}, company, voucher_type
+        )
+        name = _utilization_name(budget_info, budget_key.split("|", 1)[0], _dimension_key(budget_key), voucher_type)
+        locked[budget_key] = _read_utilization(name, for_update=True)
+
+    def get_allocated(account, budget_key, budget_info, voucher_type):
+        if budget_key in locked:
+            return locked[budget_key]
+        return get_budget_utilization(account, budget_key, budget_info, voucher_type)
+
+    return get_allocated
+
+def get_budget_postings(doc, budget_index):
+    """Amount a submitted document adds to each budget line it matches"""
+    if doc.doctype not in ACCOUNT_FIELD_MAP:
+        return {}
+
+    child_table, account_fields = ACCOUNT_FIELD_MAP[doc.doctype]
+    rows = doc.get(child_table, []) or []
+
+    items = get_item_attributes([_row_get(row, "item_code") for row in rows])
+    postings = {}
+    for row in rows:
+        amt = flt(_row_get(row, "amount") or 0)
+        item_code = _row_get(row, "item_code")
+        if not item_code or amt <= 0:
+            continue
+
+        item = items.get(item_code)
+        acct = get_row_account(row, account_fields, bool(item and item.is_fixed_asset))
+        if not acct:
+            continue
+
+        for budget_info in iter_matching_budgets(acct, get_row_dimensions(row, doc), budget_index):
+            _add_posting(postings, budget_info, amt)
+
+    return postings
+
+def _add_posting(postings, budget_info, amount):
+    posting = postings.setdefault(budget_info["key"], {"budget_info": budget_info, "amount": 0.0})
+    posting["amount"] += amount
+
+def get_utilization_upsert_query(key, budget_info, company, voucher_type, amount):
+    """Query and values adding `amount` to the utilization row of budget line `key`"""
+    account, dimension_key = key.split("|", 1)
+    now = frappe.utils.now()
+    return (
+        f"""
+        insert into `tab{UTILIZATION_DOCTYPE}`
+            (name, creation, modified, owner, modified_by, capital_budget, company, account,
+            voucher_type, budget_against, budget_against_value, department, dimension_key, amount)
+        values
+            (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(capital_budget)s, %(company)s, %(account)s,
+            %(voucher_type)s, %(budget_against)s, %(budget_against_value)s, %(department)s, %(dimension_key)s, %(amount)s)
+        on duplicate key update
+            amount = amount + values(amount), capital_budget = values(capital_budget),
+            modified = values(modified), modified_by = values(modified_by)
+        """,
+        {
+            "name": _utilization_name(budget_info, account, dimension_key, voucher_type),
+            "now": now,
+            "user": frappe.session.user,
+            "capital_budget": budget_info["budget_name"],
+            "company": company,
+            "account": account,
+            "voucher_type": voucher_type,
+            "budget_against": budget_info["budget_against"],
+            "budget_against_value": budget_info["budget_against_value"],
+            "department": budget_info["department"],
+            "dimension_key": dimension_key,
+            "amount": flt(amount),
+        },
+    )
+
+def update_budget_utilization(postings, company, voucher_type, sign=1):
+    """Add (or with sign=-1 remove) amounts on the running utilization rows"""
+    # fixed order keeps concurrent postings on shared rows from deadlocking
+    for key, posting in sorted(postings.items()):
+        frappe.db.sql(
+            *get_utilization_upsert_query(key, posting["budget_info"], company, voucher_type, sign * posting["amount"])
+        )
+
+def _post_document(doc, sign):
+    company = _doc_get(doc, "company")
+    if not company:
         return
-        
-    summary_html = "<div style='margin: 20px 0;'>"
-    summary_html += f"<h4>📊 Capital Budget Summary After This {doctype}:</h4>"
-    
+
+    budget_index = get_budget_index(company)
+    if not budget_index:
+        return
+
+    postings = get_budget_postings(doc, budget_index)
+    if postings:
+        update_budget_utilization(postings, company, doc.doctype, sign)
+
+def post_budget_utilization(doc, method=None):
+    """on_submit: add the document to the utilization ledger"""
+    _post_document(doc, 1)
+
+def reverse_budget_utilization(doc, method=None):
+    """on_cancel: take the document back out of the utilization ledger"""
+    _post_document(doc, -1)
+
+def repost_budget_utilization(doc, method=None):
+    """on_update_after_submit: replace the postings of the previous version with the current ones"""
+    previous = doc.get_doc_before_save()
+    company = _doc_get(doc, "company")
+    if not previous or not company:
+        return
+
+    budget_index = get_budget_index(company)
+    if not budget_index:
+        return
+
+    postings = {}
+    for version, sign in ((previous, -1), (doc, 1)):
+        for posting in get_budget_postings(version, budget_index).values():
+            _add_posting(postings, posting["budget_info"], sign * posting["amount"])
+
+    postings = {key: posting for key, posting in postings.items() if flt(posting["amount"])}
+    if postings:
+        update_budget_utilization(postings, company, doc.doctype)
+
+def rebuild_budget_utilization(company=None):
+    """Recompute the utilization ledger from submitted source documents"""
+    companies = [company] if company else frappe.get_all(
+        "Capital Budget", filters={"docstatus": 1}, pluck="company", distinct=True
+    )
+
+    for company in companies:
+        frappe.db.delete(UTILIZATION_DOCTYPE, {"company": company})
+
+        clear_budget_index(company)
+        budget_index = get_budget_index(company)
+        if not budget_index:
+            continue
+
+        for dt in ACCOUNT_FIELD_MAP:
+            postings = {}
+            for account in budget_index:
+                for transaction in get_existing_account_transactions(account, company, None, dt):
+                    for budget_info in iter_matching_budgets(account, transaction["dimensions"], budget_index):
+                        _add_posting(postings, budget_info, transaction["amount"])
+
+            if postings:
+                update_budget_utilization(postings, company, dt)
+
+def backfill_budget_utilization(budget_name, company):
+    """Capital Budget on_submit: seed the utilization rows of budget lines this budget introduces
+
+    Rows are keyed by budget line, not budget name, so lines another submitted budget already
+    has keep their running totals. Runs in the submit transaction: the new lines and their
+    totals become visible together, and only the new rows are written, so no submit in
+    progress elsewhere has to wait on it.
+    """
+    budget_index = _build_budget_index(company)
+    existing_keys = {
+        line["key"] for lines in _build_budget_index(company, exclude_budget=budget_name).values() for line in lines
+    }
+    introduced = {
+        line["key"]: line
+        for lines in budget_index.values()
+        for line in lines
+        if line["key"] not in existing_keys and line["budget_name"] == budget_name
+    }
+    if not introduced:
+        return
+
+    for dt in ACCOUNT_FIELD_MAP:
+        # rows left behind by a cancelled budget on the same line stopped receiving postings
+        frappe.db.delete(
+            UTILIZATION_DOCTYPE,
+            {"name": ("in", [
+                _utilization_name(line, key.split("|", 1)[0], _dimension_key(key), dt)
+                for key, line in introduced.items()
+            ])},
+        )
+
+        postings = {}
+        for account in {key.split("|", 1)[0] for key in introduced}:
+            for transaction in get_existing_account_transactions(account, company, None, dt):
+                for budget_info in iter_matching_budgets(account, transaction["dimensions"], budget_index):
+                    if budget_info["key"] in introduced:
+                        _add_posting(postings, budget_info, transaction["amount"])
+
+        if postings:
+            update_budget_utilization(postings, company, dt)
+
+@frappe.whitelist()
+def enqueue_budget_utilization_rebuild(company=None):
+    frappe.only_for(("Accounts Manager", "System Manager"))
+    frappe.enqueue(
+        "cgcdferp.cgcdferp.asset_account_validator.rebuild_budget_utilization",
+        queue="long",
+        timeout=3600,
+        company=company,
+        enqueue_after_commit=True,
+    )
+
+def get_budget_summary(account_budget_summary, currency):
+    """Budget, used and remaining amount per account after this document, rendered by the form after submit"""
+    accounts = []
     for account, budget_info in account_budget_summary.items():
         util = budget_info['utilization']
-        current_allocation = budget_info['current_allocation']
-        final_used = util['allocated_amount'] + current_allocation
-        final_available = util['budgeted_amount'] - final_used
-        
-        summary_html += f"<div style='margin: 15px 0; padding: 10px; border: 1px solid #ddd; border-radius: 5px;'>"
-        summary_html += f"<b>Account: {account}</b><br><br>"
-        summary_html += f"Budget: {frappe.utils.fmt_money(util['budgeted_amount'], currency=currency)}<br>"
-        summary_html += f"Used: {frappe.utils.fmt_money(final_used, currency=currency)}<br>"
-        summary_html += f"<span style='color: {'red' if final_available < 0 else 'green'}; font-weight: bold;'>"
-        summary_html += f"Remaining: {frappe.utils.fmt_money(final_available, currency=currency)}</span>"
-        summary_html += "</div>"
+        final_used = util['allocated_amount'] + budget_info['current_allocation']
+        accounts.append({
+            "account": account,
+            "budget": util['budgeted_amount'],
+            "used": final_used,
+            "remaining": util['budgeted_amount'] - final_used,
+        })
+    return {"currency": currency, "accounts": accounts}
+
+def get_account_requests(doc):
+    """Budget relevant rows of a document: account, amount and dimensions per item row"""
+    if doc.doctype not in ACCOUNT_FIELD_MAP:
+        return []
+    if doc.doctype == "Material Request" and getattr(doc, 'material_request_type', None) != "Purchase":
+        return []
+
+    child_table, account_fields = ACCOUNT_FIELD_MAP[doc.doctype]
+    rows = doc.get(child_table, []) or []
     
-    summary_html += "</div>"
-    frappe.msgprint(summary_html, title="Budget Status Update", indicator="blue")
+    items = get_item_attributes([_row_get(row, "item_code") for row in rows])
+    account_requests = []
 
-def validate_budget(doc, method=None):
-    try:
-        if doc.doctype not in ACCOUNT_FIELD_MAP:
-            return
-        if doc.doctype == "Material Request" and getattr(doc, 'material_request_type', None) != "Purchase":
-            return
-
-        child_table, account_fields = ACCOUNT_FIELD_MAP[doc.doctype]
-        rows = doc.get(child_table, []) or []
-        
-        item_cache = {}
-        account_requests = []
-
-        for row in rows:
-            amt = flt(_row_get(row, "amount") or 0)
-            item_code = _row_get(row, "item_code")
-            if not item_code or amt <= 0:
-                continue
+    for row in rows:
+        amt = flt(_row_get(row, "amount") or 0)
+        item_code = _row_get(row, "item_code")
+        if not item_code or amt <= 0:
+            continue
 
-            item = item_cache.get(item_code)
-            if item is None:
-                item = frappe.db.get_value("Item", item_code, ["item_name", "is_fixed_asset"], as_dict=True)
-                item_cache[item_code] = item
-            if not item:
-                continue
+        item = items.get(item_code)
+        if not item:
+            continue
 
-            is_asset = bool(item.get("is_fixed_asset"))
-            acct = None
-            for f in account_fields:
-                val = _row_get(row, f)
-                if val:
-                    acct = cstr(val).strip()
-                    break
+        is_asset = bool(item.get("is_fixed_asset"))
+        acct = None
+        for f in account_fields:
+            val = _row_get(row, f)
+            if val:
+                acct = cstr(val).strip()
+                break
 
-            if not acct:
-                continue
+        if not acct:
+            continue
 
-            dims = {
-                "cost_center": _row_get(row, "cost_center") or _doc_get(doc, "cost_center"),
-                "project": _row_get(row, "project") or _doc_get(doc, "project"),
-                "department": _row_get(row, "department") or _doc_get(doc, "department"),
-            }
+        dims = get_row_dimensions(row, doc)
+
+        account_requests.append({
+            "account": acct,
+            "amount": amt,
+            "dims": dims,
+            "item_code": item_code,
+            "item_name": cstr(item.get("item_name") or ""),
+            "is_fixed_asset": int(is_asset),
+        })
+
+    return account_requests
+
+def evaluate_budget(doc, account_requests, budget_index, get_allocated=None):
+    """Compare the document's total per account with its best matching budget line"""
+    account_groups = {}
+    for req in account_requests:
+        acct = req["account"]
+        account_groups.setdefault(acct, []).append(req)
+
+    results = []
+    for acct, requests in account_groups.items():
+        total_account_amount = sum(req["amount"] for req in requests)
+        dims = requests[0]["dims"]
+        
+        budget_key, budget_info = find_matching_budget(acct, dims, budget_index)
+        if not budget_key:
+            continue
+        
+        utilization = calculate_budget_utilization(
+            acct, budget_key, budget_info, _doc_get(doc, "company"), getattr(doc, 'name', None), doc.doctype,
+            get_allocated=get_allocated,
+        )
+        excess_amount = (utilization["allocated_amount"] + total_account_amount) - utilization["budgeted_amount"]
+
+        results.append({
+            "account": acct,
+            "budget_key": budget_key,
+            "budget_info": budget_info,
+            "utilization": utilization,
+            "current_allocation": total_account_amount,
+            "exceeded": excess_amount > 0,
+            "excess_amount": excess_amount,
+        })
+
+    return results
+
+def get_budget_exceeded_message(result, currency, blocked=True):
+    acct, budget_info, utilization = result["account"], result["budget_info"], result["utilization"]
+
+    # Build dimension display based on budget type
+    if budget_info['budget_against'] and budget_info['budget_against'].lower() == "department":
+        dim_display = f"Department: {budget_info['budget_against_value']}"
+    else:
+        dim_display = f"{budget_info['budget_against']}: {budget_info['budget_against_value'] or 'Any'}"
+        if budget_info['department']:
+            dim_display += f" | Department: {budget_info['department']}"
+
+    details = (
+        f"Account: <b>{acct}</b><br>"
+        f"Dimensions: {dim_display}<br><br>"
+        f"<b>Budget:</b> {frappe.utils.fmt_money(utilization['budgeted_amount'], currency=currency)}<br>"
+        f"<b>Already Used:</b> {frappe.utils.fmt_money(utilization['allocated_amount'], currency=currency)}<br>"
+        f"<b>Requested Now:</b> {frappe.utils.fmt_money(result['current_allocation'], currency=currency)}<br>"
+        f"<b style='color:red;'>Excess: {frappe.utils.fmt_money(result['excess_amount'], currency=currency)}</b><br><br>"
+    )
+
+    if not blocked:
+        return _(f"<b>Budget Exceeded!</b><br><br>{details}<b>The document was submitted. Please review the budget.</b>")
+
+    return _(
+        f"<b>Budget Exceeded! Submission Blocked.</b><br><br>"
+        f"{details}"
+        f"<b>⛔ Cannot submit. Please reduce the amount or increase the budget.</b>"
+    )
 
-            account_requests.append({
-                "account": acct,
-                "amount": amt,
-                "dims": dims,
-                "item_code": item_code,
-                "item_name": cstr(item.get("item_name") or ""),
-                "is_fixed_asset": int(is_asset),
-            })
+def validate_budget(doc, method=None):
+    with profile_check("validate_budget", doc.doctype, doc.name):
+        _validate_budget(doc)
 
-        if not account_requests:
+def _validate_budget(doc):
+    try:
+        mode = get_enforcement_mode(doc.doctype)
+        if mode == "Off":
             return
 
         company = _doc_get(doc, "company")
         if not company:
             return
 
-        budgets = frappe.get_all(
-            "Capital Budget",
-            filters={"company": company, "docstatus": 1},
-            fields=["name", "budget_against", "budget_against_value", "department"],
-            limit_page_length=1000,
-        )
-        if not budgets:
+        with span("fast path"):
+            budgeted_accounts = get_budgeted_accounts(company)
+            if not budgeted_accounts or not may_match_budget(doc, budgeted_accounts):
+                return
+
+        if mode == "Warn Async":
+            frappe.enqueue(
+                "cgcdferp.cgcdferp.asset_account_validator.notify_budget_exceeded",
+                queue="short",
+                doctype=doc.doctype,
+                name=doc.name,
+                enqueue_after_commit=True,
+            )
             return
 
-        budget_map = {}
-        for b in budgets:
-            bd = frappe.get_doc("Capital Budget", b.name)
-            department = b.get("department") or ""
-            budget_against_value = bd.budget_against_value or ""
-            
-            for acc in bd.accounts:
-                a = cstr(acc.get("account") or "").strip()
-                if not a:
-                    continue
-                key = f"{a}|{bd.budget_against}|{budget_against_value}|{department}"
-                budget_map.setdefault(key, {
-                    "amount": 0.0, 
-                    "budget_against": bd.budget_against, 
-                    "budget_against_value": budget_against_value,
-                    "department": department,
-                    "budget_name": bd.name
-                })
-                budget_map[key]["amount"] += flt(acc.get("budget_amount") or 0.0)
+        with span("item lookup"):
+            account_requests = get_account_requests(doc)
+        if not account_requests:
+            return
 
-        currency = _doc_get(doc, "currency") or _company_currency(company) or "Currency"
-        account_groups = {}
-        for req in account_requests:
-            acct = req["account"]
-            account_groups.setdefault(acct, []).append(req)
+        with span("budget map build"):
+            budget_index = get_budget_index(company)
+        if not budget_index:
+            return
 
+        currency = _doc_get(doc, "currency") or _company_currency(company) or "Currency"
         account_budget_summary = {}
 
-        for acct, requests in account_groups.items():
-            total_account_amount = sum(req["amount"] for req in requests)
-            dims = requests[0]["dims"]
-            
-            budget_key, budget_info = find_matching_budget(acct, dims, budget_map)
-            if not budget_key:
-                continue
-            
-            utilization = calculate_budget_utilization(
-                acct, budget_key, budget_info, company, getattr(doc, 'name', None), doc.doctype
-            )
-            
-            # ✅ Strict budget check
-            if (utilization["allocated_amount"] + total_account_amount) > utilization["budgeted_amount"]:
-                excess_amount = (utilization["allocated_amount"] + total_account_amount) - utilization["budgeted_amount"]
-                
-                # Build dimension display based on budget type
-                if budget_info['budget_against'] and budget_info['budget_against'].lower() == "department":
-                    dim_display = f"Department: {budget_info['budget_against_value']}"
+        with span("utilization scan"):
+            get_allocated = lock_budget_utilization(doc, account_requests, budget_index, company)
+        with span("matching"):
+            results = evaluate_budget(doc, account_requests, budget_index, get_allocated)
+
+        with span("rendering"):
+            for result in results:
+                # ✅ Strict budget check
+                if result["exceeded"]:
+                    frappe.throw(
+                        title=_("❌ Capital Budget Exceeded"),
+                        msg=get_budget_exceeded_message(result, currency),
+                    )
                 else:
-                    dim_display = f"{budget_info['budget_against']}: {budget_info['budget_against_value'] or 'Any'}"
-                    if budget_info['department']:
-                        dim_display += f" | Department: {budget_info['department']}"
-                
-                frappe.throw(
-                    title=_("❌ Capital Budget Exceeded"),
-                    msg=_(
-                        f"<b>Budget Exceeded! Submission Blocked.</b><br><br>"
-                        f"Account: <b>{acct}</b><br>"
-                        f"Dimensions: {dim_display}<br><br>"
-                        f"<b>Budget:</b> {frappe.utils.fmt_money(utilization['budgeted_amount'], currency=currency)}<br>"
-                        f"<b>Already Used:</b> {frappe.utils.fmt_money(utilization['allocated_amount'], currency=currency)}<br>"
-                        f"<b>Requested Now:</b> {frappe.utils.fmt_money(total_account_amount, currency=currency)}<br>"
-                        f"<b style='color:red;'>Excess: {frappe.utils.fmt_money(excess_amount, currency=currency)}</b><br><br>"
-                        f"<b>⛔ Cannot submit. Please reduce the amount or increase the budget.</b>"
-                    ),
-                )
-            else:
-                account_budget_summary[acct] = {
-                    "budget_key": budget_key,
-                    "utilization": utilization,
-                    "current_allocation": total_account_amount
-                }
+                    account_budget_summary[result["account"]] = {
+                        "budget_key": result["budget_key"],
+                        "utilization": result["utilization"],
+                        "current_allocation": result["current_allocation"]
+                    }
 
-        if account_budget_summary:
-            show_budget_summary(account_budget_summary, currency, doc.doctype)
+            if account_budget_summary:
+                doc.custom_budget_summary = frappe.as_json(
+                    get_budget_summary(account_budget_summary, currency), indent=None
+                )
 
-    except frappe.ValidationError:
+    except (frappe.ValidationError, frappe.QueryDeadlockError, frappe.QueryTimeoutError):
         raise
     except Exception:
+        mark_error()
         frappe.log_error(title="Capital Budget Validator Error", message=frappe.get_traceback())
+
+def notify_budget_exceeded(doctype, name):
+    """Warn Async mode: check a submitted document after commit and notify its owner of any excess"""
+    doc = frappe.get_doc(doctype, name)
+    company = _doc_get(doc, "company")
+    account_requests = get_account_requests(doc) if company else []
+    if not account_requests:
+        return
+
+    budget_index = get_budget_index(company)
+    if not budget_index:
+        return
+
+    # the document is already in the utilization ledger, so leave its own postings out
+    own_postings = get_budget_postings(doc, budget_index)
+
+    def get_allocated(account, budget_key, budget_info, voucher_type):
+        own = own_postings.get(budget_key, {}).get("amount", 0)
+        return get_budget_utilization(account, budget_key, budget_info, voucher_type) - own
+
+    currency = _doc_get(doc, "currency") or _company_currency(company) or "Currency"
+    for result in evaluate_budget(doc, account_requests, budget_index, get_allocated):
+        if not result["exceeded"]:
+            continue
+
+        frappe.get_doc({
+            "doctype": "Notification Log",
+            "for_user": doc.owner,
+            "type": "Alert",
+            "document_type": doctype,
+            "document_name": name,
+            "subject": _("Capital Budget exceeded on {0} {1} for account {2}").format(
+                _(doctype), name, result["account"]
+            ),
+            "email_content": get_budget_exceeded_message(result, currency, blocked=False),
+        }).insert(ignore_permissions=True)
+
+def _get_headroom_line(company, voucher_type, account, dims, budget_index):
+    """Matched budget line and its used amount, cached per (company, account, dimensions) for a short TTL"""
+    parts = (company, voucher_type, account, dims.get("cost_center"), dims.get("project"), dims.get("department"))
+    cache_key = f"{HEADROOM_CACHE_KEY}::{hashlib.md5('|'.join(map(cstr, parts)).encode()).hexdigest()}"
+    line = frappe.cache.get_value(cache_key)
+    if line is None:
+        budget_key, budget_info = find_matching_budget(account, dims, budget_index)
+        line = {}
+        if budget_key:
+            line = {
+                "budget_name": budget_info["budget_name"],
+                "budget_against": budget_info["budget_against"],
+                "budget_against_value": budget_info["budget_against_value"],
+                "department": budget_info["department"],
+                "budget": budget_info["amount"],
+                "used": get_budget_utilization(account, budget_key, budget_info, voucher_type),
+            }
+        frappe.cache.set_value(cache_key, line, expires_in_sec=HEADROOM_TTL)
+    return line
+
+@frappe.whitelist()
+def get_budget_headroom(doc):
+    """Lightweight budget headroom per account for the form widget
+
+    Reads the precomputed utilization ledger only; the matched line and its used amount are
+    cached for a few seconds so that typing in the items grid does not hit the database.
+    """
+    doc = frappe.get_doc(frappe.parse_json(doc) if isinstance(doc, str) else doc)
+    frappe.has_permission(doc.doctype, "read", throw=True)
+    # the widget renders on every form refresh, so users who cannot see budgets just get no lines
+    if not frappe.has_permission("Capital Budget", "read"):
+        return []
+
+    company = _doc_get(doc, "company")
+    account_requests = get_account_requests(doc) if company else []
+    if not account_requests:
+        return []
+
+    budget_index = get_budget_index(company)
+    if not budget_index:
+        return []
+
+    account_groups = {}
+    for req in account_requests:
+        group = account_groups.setdefault(req["account"], {"dims": req["dims"], "amount": 0.0})
+        group["amount"] += req["amount"]
+
+    headroom = []
+    for acct, group in account_groups.items():
+        line = _get_headroom_line(company, doc.doctype, acct, group["dims"], budget_index)
+        if not line:
+            continue
+        remaining = line["budget"] - line["used"] - group["amount"]
+        headroom.append(dict(line, account=acct, requested=group["amount"], remaining=remaining, exceeded=remaining < 0))
+
+    return headroom
+
+def _load_batch_doc(d):
+    if isinstance(d, Document):
+        return d
+
+    d = frappe._dict(frappe.parse_json(d) if isinstance(d, str) else d)
+    if d.name and set(d) <= {"doctype", "name"}:
+        return frappe.get_doc(d.doctype, d.name)
+    return frappe.get_doc(d)
+
+@frappe.whitelist()
+def validate_budget_batch(docs):
+    """Check draft documents against Capital Budget in one pass, in the given order
+
+    Budgets and utilization are loaded once per company. Each document that passes adds its
+    consumption to a running total, so document N sees documents 1..N-1 as already submitted.
+    `docs` is a list of documents (or `{"doctype", "name"}` references to saved drafts).
+    Returns one `{doctype, name, passed, message, accounts}` result per document.
+    """
+    docs = frappe.parse_json(docs) if isinstance(docs, str) else docs
+
+    budget_indexes = {}
+    utilization_cache = {}
+    pending = {}
+
+    def get_allocated(account, budget_key, budget_info, voucher_type):
+        key = (budget_key, voucher_type)
+        if key not in utilization_cache:
+            utilization_cache[key] = get_budget_utilization(account, budget_key, budget_info, voucher_type)
+        return utilization_cache[key] + pending.get(key, 0.0)
+
+    results = []
+    for d in docs or []:
+        result = frappe._dict({"doctype": None, "name": None, "passed": True, "message": None, "accounts": []})
+        results.append(result)
+        try:
+            doc = _load_batch_doc(d)
+            result.update({"doctype": doc.doctype, "name": doc.get("name")})
+            frappe.has_permission(doc.doctype, "submit", doc, throw=True)
+
+            company = _doc_get(doc, "company")
+            account_requests = get_account_requests(doc) if company else []
+            if not account_requests:
+                continue
+
+            if company not in budget_indexes:
+                budget_indexes[company] = get_budget_index(company)
+            budget_index = budget_indexes[company]
+            if not budget_index:
+                continue
+
+            currency = _doc_get(doc, "currency") or _company_currency(company) or "Currency"
+            for account_result in evaluate_budget(doc, account_requests, budget_index, get_allocated):
+                utilization = account_result["utilization"]
+                result.accounts.append({
+                    "account": account_result["account"],
+                    "budget": utilization["budgeted_amount"],
+                    "used": utilization["allocated_amount"],
+                    "requested": account_result["current_allocation"],
+                    "excess": max(account_result["excess_amount"], 0.0),
+                })
+                if account_result["exceeded"] and result.passed:
+                    result.passed = False
+                    result.message = get_budget_exceeded_message(account_result, currency)
+
+            if result.passed:
+                for key, posting in get_budget_postings(doc, budget_index).items():
+                    pending[(key, doc.doctype)] = pending.get((key, doc.doctype), 0.0) + posting["amount"]
+
+        except (frappe.ValidationError, frappe.PermissionError) as e:
+            result.passed = False
+            result.message = cstr(e)
+        except Exception:
+            result.passed = False
+            result.message = _("Budget check failed, see Error Log")
+            frappe.log_error(title="Capital Budget Batch Validator Error", message=frappe.get_traceback())
+
+    return results
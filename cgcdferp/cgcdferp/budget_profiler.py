@@ -0,0 +1,149 @@
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+
+SAMPLES_CACHE_KEY = "capital_budget_check_samples"
+SAMPLE_DOCTYPES_CACHE_KEY = "capital_budget_check_doctypes"
+MAX_SAMPLES = 1000
+LOG_DOCTYPE = "Capital Budget Check Log"
+
+def _current():
+    return getattr(frappe.local, "capital_budget_profile", None)
+
+def _probe(profile):
+    """Session query counter; every probe is itself one query, tallied so it can be left out"""
+    profile["probes"] += 1
+    return cint(frappe.db.sql("show session status like 'Questions'")[0][1])
+
+@contextmanager
+def profile_check(check, doctype, name=None):
+    """Time a budget check and its phases when profiling is enabled in Capital Budget Settings"""
+    settings = frappe.get_cached_doc("Capital Budget Settings")
+    if not settings.enable_profiling or _current() is not None:
+        yield
+        return
+
+    profile = frappe.local.capital_budget_profile = {"phases": [], "probes": 0, "status": "Passed"}
+    queries = _probe(profile)
+    probes = profile["probes"]
+    start = time.perf_counter()
+    try:
+        yield
+    except frappe.ValidationError:
+        profile["status"] = "Blocked"
+        raise
+    except Exception:
+        profile["status"] = "Error"
+        raise
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        query_count = _probe(profile) - queries - (profile["probes"] - probes)
+        frappe.local.capital_budget_profile = None
+        _record(settings, check, doctype, name, profile, duration, query_count)
+
+@contextmanager
+def span(phase):
+    """One phase of the check being profiled; a no-op otherwise"""
+    profile = _current()
+    if profile is None:
+        yield
+        return
+
+    queries = _probe(profile)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        profile["phases"].append({
+            "phase": phase,
+            "duration": flt(duration, 3),
+            "query_count": _probe(profile) - queries - 1,
+        })
+
+def mark_error():
+    """For checks that log and swallow their errors, so the sample still shows the failure"""
+    profile = _current()
+    if profile is not None:
+        profile["status"] = "Error"
+
+def note_matches(account, transaction_dims, matches):
+    """Budget lines that matched an account, kept on the profiled check in place of a debug log"""
+    profile = _current()
+    if profile is not None:
+        profile.setdefault("matches", []).append({
+            "account": account,
+            "dimensions": transaction_dims,
+            "matches": [{"key": d["key"], "score": d["score"]} for d in matches],
+        })
+
+def _record(settings, check, doctype, name, profile, duration, query_count):
+    sample = {
+        "check": check,
+        "status": profile["status"],
+        "duration": flt(duration, 3),
+        "query_count": query_count,
+        "phases": profile["phases"],
+    }
+    details = {"phases": profile["phases"], "matches": profile.get("matches", [])}
+
+    key = f"{SAMPLES_CACHE_KEY}:{doctype}"
+    frappe.cache.lpush(key, frappe.as_json(sample, indent=None))
+    frappe.cache.ltrim(key, 0, MAX_SAMPLES - 1)
+    frappe.cache.sadd(SAMPLE_DOCTYPES_CACHE_KEY, doctype)
+
+    if duration >= flt(settings.slow_check_threshold):
+        from frappe.deferred_insert import deferred_insert
+
+        # written by the scheduler, so a blocked (rolled back) submit still leaves its log
+        deferred_insert(LOG_DOCTYPE, [{
+            "doctype": LOG_DOCTYPE,
+            "check": check,
+            "reference_doctype": doctype,
+            "reference_name": name,
+            "status": profile["status"],
+            "duration": sample["duration"],
+            "query_count": query_count,
+            "details": frappe.as_json(details),
+        }])
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))]
+
+def _summarize(samples):
+    durations = [d["duration"] for d in samples]
+    return {
+        "count": len(samples),
+        "p50": _percentile(durations, 50),
+        "p95": _percentile(durations, 95),
+        "p50_queries": _percentile([d["query_count"] for d in samples], 50),
+    }
+
+@frappe.whitelist()
+def get_budget_check_stats():
+    """p50/p95 duration (ms) and query count of the recent budget checks, per transaction doctype and phase"""
+    frappe.only_for(("Accounts Manager", "System Manager"))
+
+    stats = {}
+    for doctype in sorted(frappe.safe_decode(d) for d in frappe.cache.smembers(SAMPLE_DOCTYPES_CACHE_KEY)):
+        samples = [
+            frappe.parse_json(frappe.safe_decode(d))
+            for d in frappe.cache.lrange(f"{SAMPLES_CACHE_KEY}:{doctype}", 0, MAX_SAMPLES - 1)
+        ]
+        if not samples:
+            continue
+
+        phases = {}
+        for sample in samples:
+            for phase in sample["phases"]:
+                phases.setdefault(phase["phase"], []).append(phase)
+
+        stats[doctype] = _summarize(samples)
+        stats[doctype]["phases"] = {phase: _summarize(rows) for phase, rows in phases.items()}
+
+    return stats
@@ -11,6 +11,17 @@ from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
 )
 from erpnext.accounts.utils import get_fiscal_year
 
+from cgcdferp.cgcdferp.asset_account_validator import (
+	backfill_budget_utilization,
+	clear_budget_index,
+	get_budgeted_accounts,
+)
+from cgcdferp.cgcdferp.budget_profiler import profile_check, span
+from cgcdferp.cgcdferp.tree_index import get_ancestors, get_descendants
+
+
+DISTRIBUTION_CURVE_CACHE_KEY = "capital_budget_distribution_curve"
+
 
 class BudgetError(frappe.ValidationError):
 	pass
@@ -131,10 +142,46 @@ class CapitalBudget(Document):
 	def before_naming(self):
 		self.naming_series = f"{{{frappe.scrub(self.budget_against)}}}./.{self.fiscal_year}/.###"
 
+	def on_submit(self):
+		clear_budget_index(self.company)
+		backfill_budget_utilization(self.name, self.company)
+		self.backfill_monthly_actuals()
+
+	def on_cancel(self):
+		# utilization rows are keyed by budget line, so the totals of the remaining lines stand
+		clear_budget_index(self.company)
+
+	def on_update_after_submit(self):
+		clear_budget_index(self.company)
+
+	def backfill_monthly_actuals(self):
+		# actuals are only kept for budgeted accounts, so a newly budgeted account has no history yet
+		frappe.enqueue(
+			"cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual.rebuild_monthly_actuals",
+			queue="long",
+			timeout=3600,
+			company=self.company,
+			fiscal_year=self.fiscal_year,
+			accounts=[d.account for d in self.get("accounts")],
+			enqueue_after_commit=True,
+		)
+
 
 def validate_expense_against_capital_budget(args, expense_amount=0):
 	args = frappe._dict(args)
-	if not frappe.get_all("Capital Budget", limit=1):
+	with profile_check(
+		"validate_expense_against_capital_budget", args.get("doctype") or "Capital Budget", args.get("parent")
+	):
+		_validate_expense_against_capital_budget(args, expense_amount)
+
+
+def _validate_expense_against_capital_budget(args, expense_amount=0):
+	budgeted_accounts = None
+	if args.get("company"):
+		budgeted_accounts = get_budgeted_accounts(args.company)
+		if not budgeted_accounts:
+			return
+	elif not frappe.get_all("Capital Budget", limit=1):
 		return
 
 	if args.get("company") and not args.fiscal_year:
@@ -150,11 +197,16 @@ def validate_expense_against_capital_budget(args, expense_amount=0):
 		args.account = args.get("expense_account")
 
 	if not (args.get("account") and args.get("cost_center")) and args.item_code:
-		args.cost_center, args.account = get_item_details(args)
+		with span("item lookup"):
+			args.cost_center, args.account = get_item_details(args)
 
 	if not args.account:
 		return
 
+	# only once the account is final: get_item_details may replace it
+	if budgeted_accounts is not None and args.account not in budgeted_accounts:
+		return
+
 	default_dimensions = [
     {
         "fieldname": "project",
@@ -181,9 +233,9 @@ def validate_expense_against_capital_budget(args, expense_amount=0):
 			doctype = dimension.get("document_type")
 
 			if frappe.get_cached_value("DocType", doctype, "is_tree"):
-				lft, rgt = frappe.get_cached_value(doctype, args.get(budget_against), ["lft", "rgt"])
-				condition = f"""and exists(select name from `tab{doctype}`
-					where lft<={lft} and rgt>={rgt} and name=cb.{budget_against})"""  # nosec
+				# a node missing from the tree still matches budgets set on itself
+				ancestors = get_ancestors(doctype, args.get(budget_against)) or [args.get(budget_against)]
+				condition = f"and cb.{budget_against} in ({', '.join(frappe.db.escape(d) for d in ancestors)})"
 				args.is_tree = True
 			else:
 				condition = f"and cb.{budget_against}={frappe.db.escape(args.get(budget_against))}"
@@ -192,29 +244,31 @@ def validate_expense_against_capital_budget(args, expense_amount=0):
 			args.budget_against_field = budget_against
 			args.budget_against_doctype = doctype
 
-			budget_records = frappe.db.sql(
-				f"""
-				select
-					cb.{budget_against} as budget_against, ba.budget_amount, cb.monthly_distribution,
-					ifnull(cb.applicable_on_material_request, 0) as for_material_request,
-					ifnull(applicable_on_purchase_order, 0) as for_purchase_order,
-					ifnull(applicable_on_booking_actual_expenses,0) as for_actual_expenses,
-					cb.action_if_annual_budget_exceeded, cb.action_if_accumulated_monthly_budget_exceeded,
-					cb.action_if_annual_budget_exceeded_on_mr, cb.action_if_accumulated_monthly_budget_exceeded_on_mr,
-					cb.action_if_annual_budget_exceeded_on_po, cb.action_if_accumulated_monthly_budget_exceeded_on_po
-				from
-					`tabCapital Budget` cb, `tabBudget Account` ba
-				where
-					cb.name=ba.parent and cb.fiscal_year=%s
-					and ba.account=%s and cb.docstatus=1
-					{condition}
-			""",
-				(args.fiscal_year, args.account),
-				as_dict=True,
-			)  # nosec
+			with span("budget records"):
+				budget_records = frappe.db.sql(
+					f"""
+					select
+						cb.{budget_against} as budget_against, ba.budget_amount, cb.monthly_distribution,
+						ifnull(cb.applicable_on_material_request, 0) as for_material_request,
+						ifnull(applicable_on_purchase_order, 0) as for_purchase_order,
+						ifnull(applicable_on_booking_actual_expenses,0) as for_actual_expenses,
+						cb.action_if_annual_budget_exceeded, cb.action_if_accumulated_monthly_budget_exceeded,
+						cb.action_if_annual_budget_exceeded_on_mr, cb.action_if_accumulated_monthly_budget_exceeded_on_mr,
+						cb.action_if_annual_budget_exceeded_on_po, cb.action_if_accumulated_monthly_budget_exceeded_on_po
+					from
+						`tabCapital Budget` cb, `tabBudget Account` ba
+					where
+						cb.name=ba.parent and cb.fiscal_year=%s
+						and ba.account=%s and cb.docstatus=1
+						{condition}
+				""",
+					(args.fiscal_year, args.account),
+					as_dict=True,
+				)  # nosec
 
 			if budget_records:
-				validate_capital_budget_records(args, budget_records, expense_amount)
+				with span("comparison"):
+					validate_capital_budget_records(args, budget_records, expense_amount)
 
 
 def validate_capital_budget_records(args, budget_records, expense_amount):
@@ -224,6 +278,16 @@ def validate_capital_budget_records(args, budget_records, expense_amount):
 			args["for_material_request"] = budget.for_material_request
 			args["for_purchase_order"] = budget.for_purchase_order
 
+			if yearly_action not in ("Stop", "Warn") and monthly_action not in ("Stop", "Warn"):
+				continue
+
+			# both checks are evaluated from one read of each source
+			args["month_end_date"] = get_last_day(args.posting_date)
+			annual_expense, monthly_expense = get_actual_expense_totals(args)
+			requested_amount = ordered_amount = 0
+			if not expense_amount:
+				requested_amount, ordered_amount = get_requested_amount(args), get_ordered_amount(args)
+
 			if yearly_action in ("Stop", "Warn"):
 				compare_expense_with_capital_budget(
 					args,
@@ -232,6 +296,7 @@ def validate_capital_budget_records(args, budget_records, expense_amount):
 					yearly_action,
 					budget.budget_against,
 					expense_amount,
+					expense_totals=(annual_expense, requested_amount, ordered_amount),
 				)
 
 			if monthly_action in ["Stop", "Warn"]:
@@ -239,8 +304,6 @@ def validate_capital_budget_records(args, budget_records, expense_amount):
 					budget.monthly_distribution, args.posting_date, args.fiscal_year, budget.budget_amount
 				)
 
-				args["month_end_date"] = get_last_day(args.posting_date)
-
 				compare_expense_with_capital_budget(
 					args,
 					budget_amount,
@@ -248,14 +311,21 @@ def validate_capital_budget_records(args, budget_records, expense_amount):
 					monthly_action,
 					budget.budget_against,
 					expense_amount,
+					expense_totals=(monthly_expense, requested_amount, ordered_amount),
 				)
 
 
-def compare_expense_with_capital_budget(args, budget_amount, action_for, action, budget_against, amount=0):
-	args.actual_expense, args.requested_amount, args.ordered_amount = get_actual_expense(args), 0, 0
-	if not amount:
-		args.requested_amount, args.ordered_amount = get_requested_amount(args), get_ordered_amount(args)
+def compare_expense_with_capital_budget(
+	args, budget_amount, action_for, action, budget_against, amount=0, expense_totals=None
+):
+	if expense_totals:
+		args.actual_expense, args.requested_amount, args.ordered_amount = expense_totals
+	else:
+		args.actual_expense, args.requested_amount, args.ordered_amount = get_actual_expense(args), 0, 0
+		if not amount:
+			args.requested_amount, args.ordered_amount = get_requested_amount(args), get_ordered_amount(args)
 
+	if not amount:
 		if args.get("doctype") == "Material Request" and args.for_material_request:
 			amount = args.requested_amount + args.ordered_amount
 
@@ -440,40 +510,39 @@ def get_other_condition(args, for_doc):
 	return condition
 
 
-def get_actual_expense(args):
+def get_actual_expense_conditions(args):
 	if not args.budget_against_doctype:
 		args.budget_against_doctype = frappe.unscrub(args.budget_against_field)
 
 	budget_against_field = args.get("budget_against_field")
-	condition1 = " and gle.posting_date <= %(month_end_date)s" if args.get("month_end_date") else ""
 
 	if args.is_tree:
-		lft_rgt = frappe.db.get_value(
-			args.budget_against_doctype, args.get(budget_against_field), ["lft", "rgt"], as_dict=1
+		args.dimension_values = tuple(
+			get_descendants(args.budget_against_doctype, args.get(budget_against_field))
+			or [args.get(budget_against_field)]
 		)
 
-		args.update(lft_rgt)
+		return "and cbma.dimension_value in %(dimension_values)s"
+
+	return f"and cbma.dimension_value = %({budget_against_field})s"
 
-		condition2 = f"""and exists(select name from `tab{args.budget_against_doctype}`
-			where lft>=%(lft)s and rgt<=%(rgt)s
-			and name=gle.{budget_against_field})"""
-	else:
-		condition2 = f"""and exists(select name from `tab{args.budget_against_doctype}`
-		where name=gle.{budget_against_field} and
-		gle.{budget_against_field} = %({budget_against_field})s)"""
+
+def get_actual_expense(args):
+	"""Actual expense on the budget's account and dimension, read from Capital Budget Monthly Actual"""
+	condition1 = " and cbma.period <= %(month_end_date)s" if args.get("month_end_date") else ""
+	condition2 = get_actual_expense_conditions(args)
 
 	amount = flt(
 		frappe.db.sql(
 			f"""
-		select sum(gle.debit) - sum(gle.credit)
-		from `tabGL Entry` gle
+		select sum(cbma.amount)
+		from `tabCapital Budget Monthly Actual` cbma
 		where
-			is_cancelled = 0
-			and gle.account=%(account)s
+			cbma.company=%(company)s
+			and cbma.account=%(account)s
+			and cbma.fiscal_year=%(fiscal_year)s
+			and cbma.dimension_field=%(budget_against_field)s
 			{condition1}
-			and gle.fiscal_year=%(fiscal_year)s
-			and gle.company=%(company)s
-			and gle.docstatus=1
 			{condition2}
 	""",
 			(args),
@@ -483,30 +552,82 @@ def get_actual_expense(args):
 	return amount
 
 
+def get_actual_expense_totals(args):
+	"""Annual and up to `month_end_date` actual expense, from a single conditional aggregate"""
+	condition = get_actual_expense_conditions(args)
+
+	annual, accumulated = frappe.db.sql(
+		f"""
+		select
+			sum(cbma.amount),
+			sum(case when cbma.period <= %(month_end_date)s then cbma.amount else 0 end)
+		from `tabCapital Budget Monthly Actual` cbma
+		where
+			cbma.company=%(company)s
+			and cbma.account=%(account)s
+			and cbma.fiscal_year=%(fiscal_year)s
+			and cbma.dimension_field=%(budget_against_field)s
+			{condition}
+	""",
+		(args),
+	)[0]  # nosec
+
+	return flt(annual), flt(accumulated)
+
+
 def get_accumulated_monthly_budget(monthly_distribution, posting_date, fiscal_year, annual_budget):
-	distribution = {}
+	year_start_date = getdate(frappe.get_cached_value("Fiscal Year", fiscal_year, "year_start_date"))
+	posting_date = getdate(posting_date)
+
+	months = (posting_date.year - year_start_date.year) * 12 + posting_date.month - year_start_date.month
+	if posting_date.day < year_start_date.day:
+		months -= 1
+
+	if months < 0:
+		return 0.0
+
 	if monthly_distribution:
-		for d in frappe.db.sql(
+		accumulated_percentage = get_distribution_curve(monthly_distribution, fiscal_year)[min(months, 11)]
+	else:
+		accumulated_percentage = 100.0 * min(months + 1, 12) / 12
+
+	return annual_budget * accumulated_percentage / 100
+
+
+def get_distribution_curve(monthly_distribution, fiscal_year):
+	"""Cumulative percentage per month of the fiscal year, cached until the distribution changes"""
+	key = f"{monthly_distribution}|{fiscal_year}"
+	curve = frappe.cache.hget(DISTRIBUTION_CURVE_CACHE_KEY, key)
+	if curve is None:
+		curve = _build_distribution_curve(monthly_distribution, fiscal_year)
+		frappe.cache.hset(DISTRIBUTION_CURVE_CACHE_KEY, key, curve)
+
+	return curve
+
+
+def _build_distribution_curve(monthly_distribution, fiscal_year):
+	distribution = dict(
+		frappe.db.sql(
 			"""select mdp.month, mdp.percentage_allocation
-			from `tabMonthly Distribution Percentage` mdp, `tabMonthly Distribution` md
-			where mdp.parent=md.name and md.fiscal_year=%s""",
-			fiscal_year,
-			as_dict=1,
-		):
-			distribution.setdefault(d.month, d.percentage_allocation)
+			from `tabMonthly Distribution Percentage` mdp
+			where mdp.parent=%s""",
+			monthly_distribution,
+		)
+	)
 
 	dt = frappe.get_cached_value("Fiscal Year", fiscal_year, "year_start_date")
-	accumulated_percentage = 0.0
-
-	while dt <= getdate(posting_date):
-		if monthly_distribution:
-			accumulated_percentage += distribution.get(getdate(dt).strftime("%B"), 0)
-		else:
-			accumulated_percentage += 100.0 / 12
+	curve, accumulated_percentage = [], 0.0
 
+	for _month in range(12):
+		accumulated_percentage += flt(distribution.get(getdate(dt).strftime("%B")))
+		curve.append(accumulated_percentage)
 		dt = add_months(dt, 1)
 
-	return annual_budget * accumulated_percentage / 100
+	return curve
+
+
+def clear_distribution_curves(doc=None, method=None):
+	frappe.cache.delete_key(DISTRIBUTION_CURVE_CACHE_KEY)
 
 
 def get_item_details(args):
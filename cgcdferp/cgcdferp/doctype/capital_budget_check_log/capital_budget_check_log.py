@@ -0,0 +1,30 @@
+# Copyright (c) 2025, Farhan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class CapitalBudgetCheckLog(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		check: DF.Data | None
+		details: DF.Code | None
+		duration: DF.Float
+		query_count: DF.Int
+		reference_doctype: DF.Link | None
+		reference_name: DF.DynamicLink | None
+		status: DF.Data | None
+	# end: auto-generated types
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Capital Budget Check Log", ["reference_doctype", "creation"])
@@ -0,0 +1,8 @@
+// Copyright (c) 2025, Farhan and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Capital Budget Monthly Actual", {
+// 	refresh(frm) {
+
+// 	},
+// });
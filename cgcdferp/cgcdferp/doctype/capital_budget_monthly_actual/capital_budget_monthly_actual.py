@@ -0,0 +1,204 @@
+# Copyright (c) 2025, Farhan and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cstr, getdate, now
+
+from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
+	get_accounting_dimensions,
+)
+
+from cgcdferp.cgcdferp.asset_account_validator import get_budgeted_accounts
+
+
+class CapitalBudgetMonthlyActual(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		account: DF.Link | None
+		amount: DF.Float
+		company: DF.Link | None
+		dimension_field: DF.Data | None
+		dimension_value: DF.Data | None
+		fiscal_year: DF.Link | None
+		period: DF.Date | None
+	# end: auto-generated types
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index(
+		"Capital Budget Monthly Actual",
+		["company", "account", "fiscal_year", "dimension_field", "dimension_value", "period"],
+		"company_account_fiscal_year_dimension_index",
+	)
+
+
+def get_dimension_fields():
+	"""GL Entry fields a Capital Budget can be set against"""
+	fieldnames = ["project", "cost_center", "department"] + [
+		d.fieldname for d in get_accounting_dimensions(as_list=False)
+	]
+	meta = frappe.get_meta("GL Entry")
+	return [f for f in dict.fromkeys(fieldnames) if meta.has_field(f)]
+
+
+def get_actual_name(fiscal_year, company, account, dimension_field, dimension_value, period):
+	key = "|".join(cstr(v) for v in (fiscal_year, company, account, dimension_field, dimension_value, period))
+	return hashlib.md5(key.encode()).hexdigest()
+
+
+def update_monthly_actuals(doc, method=None):
+	"""GL Entry on_submit / on_cancel: mark the monthly actuals the entry falls into for a refresh
+
+	Only accounts with a Capital Budget line are kept. The touched cells are summed again from
+	GL Entry once, just before the transaction commits, rather than adjusted by each entry's
+	amount: reposts delete GL Entries with plain SQL before submitting the new ones, so an
+	increment would count the reposted voucher twice.
+	"""
+	if doc.account not in get_budgeted_accounts(doc.company):
+		return
+
+	cells = frappe.flags.capital_budget_actual_cells
+	if cells is None:
+		cells = frappe.flags.capital_budget_actual_cells = set()
+		frappe.db.before_commit.add(refresh_monthly_actuals)
+		frappe.db.after_rollback.add(lambda: frappe.flags.pop("capital_budget_actual_cells", None))
+
+	period = getdate(doc.posting_date).replace(day=1)
+	for dimension_field in get_dimension_fields():
+		dimension_value = doc.get(dimension_field)
+		if dimension_value:
+			cells.add((doc.company, doc.account, doc.fiscal_year, dimension_field, dimension_value, period))
+
+
+def get_refresh_cell_query(cell):
+	"""Query and values summing one (company, account, fiscal year, dimension, value, month) cell from GL Entry"""
+	company, account, fiscal_year, dimension_field, dimension_value, period = cell
+	return (
+		f"""
+		insert into `tabCapital Budget Monthly Actual`
+			(name, creation, modified, owner, modified_by, company, fiscal_year, account,
+			dimension_field, dimension_value, period, amount)
+		select
+			%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(company)s, %(fiscal_year)s, %(account)s,
+			%(dimension_field)s, %(dimension_value)s, %(period)s, ifnull(sum(gle.debit) - sum(gle.credit), 0)
+		from `tabGL Entry` gle
+		where
+			gle.company = %(company)s
+			and gle.account = %(account)s
+			and gle.fiscal_year = %(fiscal_year)s
+			and gle.{dimension_field} = %(dimension_value)s
+			and gle.posting_date between %(period)s and last_day(%(period)s)
+			and gle.is_cancelled = 0
+			and gle.docstatus = 1
+		on duplicate key update
+			amount = values(amount), modified = values(modified)
+		""",
+		{
+			"name": get_actual_name(fiscal_year, company, account, dimension_field, dimension_value, period),
+			"now": now(),
+			"user": frappe.session.user,
+			"company": company,
+			"fiscal_year": fiscal_year,
+			"account": account,
+			"dimension_field": dimension_field,
+			"dimension_value": dimension_value,
+			"period": period,
+		},
+	)
+
+
+def refresh_monthly_actuals():
+	"""before_commit: sum each cell touched in the transaction again from GL Entry"""
+	cells = frappe.flags.pop("capital_budget_actual_cells", None) or ()
+
+	for cell in sorted(cells):
+		frappe.db.sql(*get_refresh_cell_query(cell))
+
+
+def rebuild_monthly_actuals(company=None, fiscal_year=None, accounts=None):
+	"""Recompute the monthly actuals of budgeted accounts from submitted, non-cancelled GL Entries
+
+	`accounts` narrows the rebuild further, e.g. to the lines of a newly submitted Capital Budget.
+	"""
+	companies = [company] if company else frappe.get_all(
+		"Capital Budget", filters={"docstatus": 1}, pluck="company", distinct=True
+	)
+
+	for company in companies:
+		budgeted_accounts = get_budgeted_accounts(company)
+		if accounts:
+			budgeted_accounts = budgeted_accounts & set(accounts)
+
+		filters = {"company": company}
+		if fiscal_year:
+			filters["fiscal_year"] = fiscal_year
+		if accounts:
+			filters["account"] = ("in", list(accounts))
+
+		frappe.db.delete("Capital Budget Monthly Actual", filters)
+		if not budgeted_accounts:
+			continue
+
+		conditions = " and gle.fiscal_year = %(fiscal_year)s" if fiscal_year else ""
+		for dimension_field in get_dimension_fields():
+			frappe.db.sql(
+				f"""
+				insert into `tabCapital Budget Monthly Actual`
+					(name, creation, modified, owner, modified_by, company, fiscal_year, account,
+					dimension_field, dimension_value, period, amount)
+				select
+					md5(concat_ws('|', gle.fiscal_year, gle.company, gle.account, %(dimension_field)s,
+						gle.{dimension_field}, date_format(gle.posting_date, %(period_format)s))),
+					%(now)s, %(now)s, %(user)s, %(user)s, gle.company, gle.fiscal_year, gle.account,
+					%(dimension_field)s, gle.{dimension_field}, date_format(gle.posting_date, %(period_format)s),
+					sum(gle.debit) - sum(gle.credit)
+				from `tabGL Entry` gle
+				where
+					gle.company = %(company)s
+					and gle.account in %(accounts)s
+					and gle.is_cancelled = 0
+					and gle.docstatus = 1
+					and ifnull(gle.{dimension_field}, '') != ''
+					{conditions}
+				group by
+					gle.fiscal_year, gle.company, gle.account, gle.{dimension_field},
+					date_format(gle.posting_date, %(period_format)s)
+				""",
+				dict(
+					company=company,
+					fiscal_year=fiscal_year,
+					accounts=tuple(budgeted_accounts),
+					dimension_field=dimension_field,
+					period_format="%Y-%m-01",
+					now=now(),
+					user=frappe.session.user,
+				),
+			)
+
+
+def reconcile_monthly_actuals():
+	"""Daily: rebuild the actuals of the current fiscal years
+
+	Catches cells a repost emptied without posting new entries into them, which the
+	GL Entry hook never sees, and backfills accounting dimensions added during the year.
+	"""
+	today = getdate()
+	for fiscal_year in frappe.get_all(
+		"Fiscal Year",
+		filters={"disabled": 0, "year_start_date": ("<=", today), "year_end_date": (">=", today)},
+		pluck="name",
+	):
+		rebuild_monthly_actuals(fiscal_year=fiscal_year)
+		frappe.db.commit()
+
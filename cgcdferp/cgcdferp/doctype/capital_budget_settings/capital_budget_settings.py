@@ -0,0 +1,62 @@
+# Copyright (c) 2025, Farhan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+ENFORCEMENT_MODES = ("Block", "Warn Async", "Off")
+
+# Transactions whose rows carry an item_code can match a budget line and block by default.
+# The rest never reach a match in validate_budget, so they skip the check unless configured.
+DEFAULT_ENFORCEMENT_MODES = {
+	"Purchase Order": "Block",
+	"Purchase Invoice": "Block",
+	"Material Request": "Block",
+	"Purchase Receipt": "Block",
+	"Stock Entry": "Block",
+	"Landed Cost Voucher": "Off",
+	"Expense Claim": "Off",
+	"Payment Entry": "Off",
+	"Journal Entry": "Off",
+	"Asset": "Off",
+	"Payroll Entry": "Off",
+}
+
+
+class CapitalBudgetSettings(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		from cgcdferp.cgcdferp.doctype.capital_budget_enforcement.capital_budget_enforcement import (
+			CapitalBudgetEnforcement,
+		)
+
+		enable_profiling: DF.Check
+		enforcement: DF.Table[CapitalBudgetEnforcement]
+		slow_check_threshold: DF.Float
+	# end: auto-generated types
+
+	def validate(self):
+		seen = set()
+		for row in self.enforcement:
+			if row.document_type in seen:
+				frappe.throw(
+					_("Row #{0}: {1} is listed more than once").format(row.idx, frappe.bold(row.document_type))
+				)
+			seen.add(row.document_type)
+
+
+def get_enforcement_mode(doctype):
+	"""Block, Warn Async or Off for submits of `doctype`"""
+	settings = frappe.get_cached_doc("Capital Budget Settings")
+	for row in settings.enforcement:
+		if row.document_type == doctype:
+			return row.mode
+
+	return DEFAULT_ENFORCEMENT_MODES.get(doctype, "Block")
@@ -0,0 +1,33 @@
+# Copyright (c) 2025, Farhan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class CapitalBudgetUtilization(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		account: DF.Link | None
+		amount: DF.Float
+		budget_against: DF.Data | None
+		budget_against_value: DF.Data | None
+		capital_budget: DF.Link | None
+		company: DF.Link | None
+		department: DF.Data | None
+		dimension_key: DF.Data | None
+		voucher_type: DF.Link | None
+	# end: auto-generated types
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Capital Budget Utilization", ["company", "account"])
+	frappe.db.add_index("Capital Budget Utilization", ["capital_budget", "account", "dimension_key"])
@@ -0,0 +1,91 @@
+# Copyright (c) 2025, Farhan and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cgcdferp.cgcdferp.asset_account_validator import (
+	clear_budget_index,
+	get_budget_index,
+	get_budget_utilization,
+	post_budget_utilization,
+	repost_budget_utilization,
+	reverse_budget_utilization,
+	validate_budget_batch,
+)
+
+COMPANY = "_Test Company"
+ACCOUNT = "_Test Account Cost for Goods Sold - _TC"
+COST_CENTER = "_Test Utilization Cost Center"
+ITEM = "_Test Utilization Item"
+
+
+class TestCapitalBudgetUtilization(FrappeTestCase):
+	def setUp(self):
+		if not frappe.db.exists("Item", ITEM):
+			frappe.get_doc(
+				{"doctype": "Item", "name": ITEM, "item_code": ITEM, "item_name": ITEM, "is_fixed_asset": 0}
+			).db_insert()
+
+		# inserted directly, so submit hooks and the background rebuild stay out of the test
+		budget = frappe.get_doc(
+			{
+				"doctype": "Capital Budget",
+				"name": "_T-Utilization-Budget",
+				"company": COMPANY,
+				"fiscal_year": frappe.db.get_value("Fiscal Year", {}, "name"),
+				"budget_against": "Cost Center",
+				"budget_against_value": COST_CENTER,
+				"docstatus": 1,
+			}
+		)
+		budget.db_insert()
+		budget.append("accounts", {"account": ACCOUNT, "budget_amount": 100}).db_insert()
+		clear_budget_index(COMPANY)
+
+	def make_purchase_order(self, name, amount):
+		return frappe.get_doc(
+			{
+				"doctype": "Purchase Order",
+				"name": name,
+				"company": COMPANY,
+				"items": [
+					{"item_code": ITEM, "amount": amount, "expense_account": ACCOUNT, "cost_center": COST_CENTER}
+				],
+			}
+		)
+
+	def get_used(self):
+		budget_info = next(
+			line for line in get_budget_index(COMPANY)[ACCOUNT] if line["budget_against_value"] == COST_CENTER
+		)
+		return get_budget_utilization(ACCOUNT, budget_info["key"], budget_info, "Purchase Order")
+
+	def test_batch_documents_see_earlier_passes_only(self):
+		results = validate_budget_batch(
+			[
+				self.make_purchase_order("_T-PO-1", 70),
+				# fits the budget alone, not after the first document
+				self.make_purchase_order("_T-PO-2", 50),
+				# the failed second document must not count towards the running total
+				self.make_purchase_order("_T-PO-3", 30),
+			]
+		)
+
+		self.assertEqual([d.passed for d in results], [True, False, True])
+		self.assertEqual(results[1].accounts[0]["used"], 70)
+		self.assertEqual(results[2].accounts[0]["used"], 70)
+
+	def test_submit_update_and_cancel_net_to_zero(self):
+		purchase_order = self.make_purchase_order("_T-PO-LEDGER", 70)
+
+		post_budget_utilization(purchase_order)
+		self.assertEqual(self.get_used(), 70)
+
+		purchase_order._doc_before_save = frappe.copy_doc(purchase_order)
+		purchase_order.items[0].amount = 40
+		repost_budget_utilization(purchase_order)
+		self.assertEqual(self.get_used(), 40)
+
+		reverse_budget_utilization(purchase_order)
+		self.assertEqual(self.get_used(), 0)
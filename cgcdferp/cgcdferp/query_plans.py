@@ -0,0 +1,116 @@
+import frappe
+from frappe.utils import add_months, getdate, nowdate
+
+def explain(query, values):
+    return frappe.db.sql(f"explain {query}", values, as_dict=True)
+
+def _sample_budget_line(company):
+    return frappe.db.sql(
+        """select cb.name, cb.fiscal_year, cb.budget_against, ba.account
+        from `tabCapital Budget` cb, `tabBudget Account` ba
+        where cb.name = ba.parent and cb.docstatus = 1 and cb.company = %s
+        order by cb.modified desc limit 1""",
+        company,
+        as_dict=True,
+    )
+
+def _budget_check_queries(company, line):
+    """Queries of validate_budget, the utilization ledger and its rebuild"""
+    from cgcdferp.cgcdferp.asset_account_validator import (
+        ACCOUNT_FIELD_MAP,
+        _account_transactions_query,
+        _account_transactions_values,
+        _utilization_name,
+        get_budget_index,
+        get_budget_lines_query,
+        get_utilization_query,
+        get_utilization_upsert_query,
+    )
+
+    yield "Capital Budget index", *get_budget_lines_query(company)
+
+    budget_info = get_budget_index(company)[line.account][0]
+    key = budget_info["key"]
+    name = _utilization_name(budget_info, line.account, key.split("|", 1)[1], "Purchase Order")
+    yield "Utilization lookup", *get_utilization_query(name)
+    yield "Utilization lock", *get_utilization_query(name, for_update=True)
+    yield "Utilization posting", *get_utilization_upsert_query(key, budget_info, company, "Purchase Order", 0)
+
+    for dt in ACCOUNT_FIELD_MAP:
+        query = _account_transactions_query(dt)
+        if query:
+            yield f"Account transactions ({dt})", query, _account_transactions_values(dt, line.account, company)
+
+def _monthly_actual_queries(company, line):
+    """Cell refresh run before commit for GL Entries on budgeted accounts"""
+    from cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual import (
+        get_refresh_cell_query,
+    )
+
+    dimension = frappe.scrub(line.budget_against)
+    year_start = frappe.get_cached_value("Fiscal Year", line.fiscal_year, "year_start_date")
+    cell = (
+        company,
+        line.account,
+        line.fiscal_year,
+        dimension,
+        frappe.db.get_value("Capital Budget", line.name, dimension),
+        getdate(year_start).replace(day=1),
+    )
+    yield "Monthly actual refresh", *get_refresh_cell_query(cell)
+
+def _variance_report_queries(company, line):
+    from cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report import (
+        get_actual_details_query,
+        get_dimension_target_details,
+        get_dimension_target_query,
+    )
+
+    filters = frappe._dict(
+        company=company,
+        from_fiscal_year=line.fiscal_year,
+        to_fiscal_year=line.fiscal_year,
+        period="Monthly",
+        budget_against=line.budget_against,
+    )
+    yield "Capital Budget Variance Report targets", *get_dimension_target_query(filters)
+
+    query = get_actual_details_query(filters, get_dimension_target_details(filters))
+    if query:
+        yield "Capital Budget Variance Report actuals", *query
+
+def _ledger_summary_queries(company):
+    from cgcdferp.cgcdferp.report.client_ledger_summary.client_ledger_summary import (
+        PartyLedgerSummaryReport,
+    )
+
+    today = nowdate()
+    report = PartyLedgerSummaryReport({"company": company, "from_date": add_months(today, -1), "to_date": today})
+    report.filters.party_type = "Customer"
+
+    yield "Client Ledger Summary totals", *report.get_party_totals_query()
+    yield "Client Ledger Summary adjustments", *report.get_adjustment_entries_query(
+        frappe.get_all("Account", filters={"company": company, "account_type": "Expense Account"}, pluck="name")
+    )
+
+def get_queries(company):
+    """(source, query, values) for every query the app runs on submit, on GL posting and in its reports
+
+    Sample values come from the latest submitted Capital Budget of `company`; without one only the
+    Client Ledger Summary queries are listed.
+    """
+    yield from _ledger_summary_queries(company)
+
+    budget_line = _sample_budget_line(company)
+    if budget_line:
+        line = budget_line[0]
+        yield from _budget_check_queries(company, line)
+        yield from _monthly_actual_queries(company, line)
+        yield from _variance_report_queries(company, line)
+
+def get_query_plans(company):
+    """EXPLAIN output for the queries behind the budget check, the monthly actuals and both reports"""
+    return [
+        {"source": source, "query": query, "plan": explain(query, values)}
+        for source, query, values in get_queries(company)
+    ]
@@ -2,17 +2,29 @@
 # For license information, please see license.txt
 
 import datetime
+import hashlib
+import time
+from array import array
+
 import frappe
 from frappe import _
-from frappe.utils import flt, formatdate
+from frappe.utils import flt, formatdate, now
 
 from erpnext.controllers.trends import get_period_date_ranges, get_period_month_ranges
 
+from cgcdferp.cgcdferp.asset_account_validator import get_budgeted_accounts
+
+REPORT_NAME = "Capital Budget Variance Report"
+STATS_CACHE_KEY = "capital_budget_variance_stats"
+MONTHS = [datetime.date(2013, month_id, 1).strftime("%B") for month_id in range(1, 13)]
+
 
 def execute(filters=None):
 	if not filters:
 		filters = {}
 
+	start = time.monotonic()
+
 	columns = get_columns(filters)
 	if filters.get("budget_against_filter"):
 		dimensions = filters.get("budget_against_filter")
@@ -20,34 +32,107 @@ def execute(filters=None):
 		dimensions = get_cost_centers(filters)
 
 	period_month_ranges = get_period_month_ranges(filters["period"], filters["from_fiscal_year"])
-	cam_map = get_dimension_account_month_map(filters)
+	cube = get_dimension_account_month_cube(filters, period_month_ranges)
 
 	data = []
 	for dimension in dimensions:
-		dimension_items = cam_map.get(dimension)
-		if dimension_items:
-			data = get_final_data(dimension, dimension_items, filters, period_month_ranges, data, 0)
+		if dimension in cube.pairs:
+			data = get_final_data(dimension, cube, filters, period_month_ranges, data, 0)
 
 	chart = get_chart_data(filters, columns, data)
 
-	return columns, data, None, chart
+	execution_time = time.monotonic() - start
+	record_execution_stats(filters, len(data), execution_time)
+
+	report_summary = [
+		{"value": len(data), "label": _("Rows"), "datatype": "Int"},
+		{"value": flt(execution_time, 2), "label": _("Execution Time (s)"), "datatype": "Float"},
+	]
+
+	return columns, data, None, chart, report_summary
+
+
+def record_execution_stats(filters, row_count, execution_time):
+	"""Keep the latest row count and run time per filter combination"""
+	filters = frappe.parse_json(frappe.as_json(filters))
+	key = hashlib.md5(frappe.as_json(filters, indent=None).encode()).hexdigest()
+
+	frappe.cache.hset(
+		STATS_CACHE_KEY,
+		key,
+		{
+			"filters": filters,
+			"row_count": row_count,
+			"execution_time": flt(execution_time, 3),
+			"executed_on": now(),
+		},
+	)
+
+
+@frappe.whitelist()
+def get_execution_stats():
+	"""Filter combinations seen by the report, slowest first"""
+	frappe.only_for(("Accounts Manager", "System Manager"))
+
+	stats = list((frappe.cache.hgetall(STATS_CACHE_KEY) or {}).values())
+	return sorted(stats, key=lambda d: d["execution_time"], reverse=True)
+
+
+def invalidate_prepared_reports(doc, method=None):
+	"""Hooked to GL Entry and Capital Budget changes; the company's stored results are dropped in the background
+
+	GL Entries only count when booked to a budgeted account, and a company is queued once per transaction
+	however many entries the voucher has.
+	"""
+	if doc.doctype == "GL Entry" and doc.account not in get_budgeted_accounts(doc.company):
+		return
+
+	queued = frappe.flags.capital_budget_variance_queued
+	if queued is None:
+		queued = frappe.flags.capital_budget_variance_queued = set()
+		for callbacks in (frappe.db.after_commit, frappe.db.after_rollback):
+			callbacks.add(lambda: frappe.flags.pop("capital_budget_variance_queued", None))
+
+	if doc.company in queued:
+		return
+	queued.add(doc.company)
+
+	frappe.enqueue(
+		"cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.delete_prepared_reports",
+		queue="long",
+		job_id=f"capital_budget_variance_invalidate::{doc.company}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		company=doc.company,
+	)
+
+
+def delete_prepared_reports(company):
+	for report in frappe.get_all(
+		"Prepared Report",
+		filters={"report_name": REPORT_NAME, "status": ("in", ("Completed", "Error"))},
+		fields=["name", "filters"],
+	):
+		if frappe.parse_json(report.filters or "{}").get("company") != company:
+			continue
+		frappe.delete_doc("Prepared Report", report.name, ignore_permissions=True, delete_permanently=True)
+
 
+def get_final_data(dimension, cube, filters, period_month_ranges, data, DCC_allocation):
+	n_months = len(cube.years) * 12
 
-def get_final_data(dimension, dimension_items, filters, period_month_ranges, data, DCC_allocation):
-	for account, monthwise_data in dimension_items.items():
+	for account, pair in cube.pairs[dimension].items():
 		row = [dimension, account]
-		totals = [0, 0, 0]
-		for year in get_fiscal_years(filters):
+		base = pair * n_months
+		totals = [sum(cube.target[base : base + n_months]), sum(cube.actual[base : base + n_months]), 0]
+
+		for year_index in range(len(cube.years)):
 			last_total = 0
+			start = base + year_index * 12
 			for relevant_months in period_month_ranges:
-				period_data = [0, 0, 0]
-				for month in relevant_months:
-					if monthwise_data.get(year[0]):
-						month_data = monthwise_data.get(year[0]).get(month, {})
-						for i, fieldname in enumerate(["target", "actual", "variance"]):
-							value = flt(month_data.get(fieldname))
-							period_data[i] += value
-							totals[i] += value
+				end = start + len(relevant_months)
+				period_data = [sum(cube.target[start:end]), sum(cube.actual[start:end]), 0]
+				start = end
 
 				period_data[0] += last_total
 
@@ -163,6 +248,10 @@ def get_cost_centers(filters):
 
 # Get dimension & target details
 def get_dimension_target_details(filters):
+	return frappe.db.sql(*get_dimension_target_query(filters), as_dict=True)
+
+
+def get_dimension_target_query(filters):
 	budget_against = frappe.scrub(filters.get("budget_against"))
 	cond = ""
 	if filters.get("budget_against_filter"):
@@ -170,7 +259,7 @@ def get_dimension_target_details(filters):
 			["%s"] * len(filters.get("budget_against_filter"))
 		)
 
-	return frappe.db.sql(
+	return (
 		f"""
 			select
 				b.{budget_against} as budget_against,
@@ -200,7 +289,6 @@ def get_dimension_target_details(filters):
 			]
 			+ (filters.get("budget_against_filter") or []),
 		),
-		as_dict=True,
 	)
 
 
@@ -231,90 +319,98 @@ def get_target_distribution_details(filters):
 
 
 # Get actual details from gl entry
-def get_actual_details(name, filters):
+def get_actual_details(filters, dimension_target_details):
+	"""Net GL movement per (dimension, account, fiscal year, month number) for the budgeted pairs"""
+	query = get_actual_details_query(filters, dimension_target_details)
+	if not query:
+		return []
+
+	return frappe.db.sql(*query, as_dict=1)
+
+
+def get_actual_details_query(filters, dimension_target_details):
 	budget_against = frappe.scrub(filters.get("budget_against"))
-	cond = ""
+	dimensions = list({d.budget_against for d in dimension_target_details})
+	accounts = list({d.account for d in dimension_target_details})
 
-	if filters.get("budget_against") == "Cost Center":
-		cc_lft, cc_rgt = frappe.db.get_value("Cost Center", name, ["lft", "rgt"])
-		cond = f"""
-				and lft >= "{cc_lft}"
-				and rgt <= "{cc_rgt}"
-			"""
+	if not (dimensions and accounts):
+		return None
 
-	ac_details = frappe.db.sql(
+	return (
 		f"""
 			select
+				gl.{budget_against} as budget_against,
 				gl.account,
-				gl.debit,
-				gl.credit,
 				gl.fiscal_year,
-				MONTHNAME(gl.posting_date) as month_name,
-				b.{budget_against} as budget_against
+				month(gl.posting_date) as month_id,
+				sum(gl.debit - gl.credit) as amount
 			from
-				`tabGL Entry` gl,
-				`tabBudget Account` ba,
-				`tabCapital Budget` b
+				`tabGL Entry` gl
 			where
-				b.name = ba.parent
-				and b.docstatus = 1
-				and ba.account=gl.account
-				and b.{budget_against} = gl.{budget_against}
-				and gl.fiscal_year between %s and %s
-				and b.{budget_against} = %s
-				and exists(
-					select
-						name
-					from
-						`tab{filters.budget_against}`
-					where
-						name = gl.{budget_against}
-						{cond}
-				)
-				group by
-					gl.name
-				order by gl.fiscal_year
+				gl.fiscal_year between %(from_fiscal_year)s and %(to_fiscal_year)s
+				and gl.{budget_against} in %(dimensions)s
+				and gl.account in %(accounts)s
+			group by
+				gl.{budget_against}, gl.account, gl.fiscal_year, month(gl.posting_date)
 		""",
-		(filters.from_fiscal_year, filters.to_fiscal_year, name),
-		as_dict=1,
+		{
+			"from_fiscal_year": filters.from_fiscal_year,
+			"to_fiscal_year": filters.to_fiscal_year,
+			"dimensions": dimensions,
+			"accounts": accounts,
+		},
 	)
 
-	cc_actual_details = {}
-	for d in ac_details:
-		cc_actual_details.setdefault(d.account, []).append(d)
-
-	return cc_actual_details
 
+def get_dimension_account_month_cube(filters, period_month_ranges):
+	"""Targets and actuals in flat arrays indexed by (dimension/account pair, fiscal year, month)
 
-def get_dimension_account_month_map(filters):
+	Months are stored in fiscal order, so every period of `period_month_ranges` is a contiguous
+	slice of a year's 12 cells and a pair's whole history is one slice of len(years) * 12.
+	"""
 	dimension_target_details = get_dimension_target_details(filters)
 	tdd = get_target_distribution_details(filters)
 
-	cam_map = {}
+	fiscal_months = [month for relevant_months in period_month_ranges for month in relevant_months]
+	month_position = {month: position for position, month in enumerate(fiscal_months)}
+	years = [year[0] for year in get_fiscal_years(filters)]
+	year_index = {year: index for index, year in enumerate(years)}
 
+	pairs, n_pairs = {}, 0
 	for ccd in dimension_target_details:
-		actual_details = get_actual_details(ccd.budget_against, filters)
-
-		for month_id in range(1, 13):
-			month = datetime.date(2013, month_id, 1).strftime("%B")
-			cam_map.setdefault(ccd.budget_against, {}).setdefault(ccd.account, {}).setdefault(
-				ccd.fiscal_year, {}
-			).setdefault(month, frappe._dict({"target": 0.0, "actual": 0.0}))
-
-			tav_dict = cam_map[ccd.budget_against][ccd.account][ccd.fiscal_year][month]
-			month_percentage = (
-				tdd.get(ccd.monthly_distribution, {}).get(month, 0)
-				if ccd.monthly_distribution
-				else 100.0 / 12
-			)
+		accounts = pairs.setdefault(ccd.budget_against, {})
+		if ccd.account not in accounts:
+			accounts[ccd.account] = n_pairs
+			n_pairs += 1
+
+	target = array("d", bytes(8 * n_pairs * len(years) * 12))
+	actual = array("d", target)
+
+	def offset(dimension, account, fiscal_year):
+		pair = pairs.get(dimension, {}).get(account)
+		if pair is None or fiscal_year not in year_index:
+			return None
+		return (pair * len(years) + year_index[fiscal_year]) * 12
+
+	# actuals are only shown for the years a pair has a budget row in, as before the cube
+	budgeted = set()
+	for ccd in dimension_target_details:
+		base = offset(ccd.budget_against, ccd.account, ccd.fiscal_year)
+		if base is None:
+			continue
+		budgeted.add(base)
 
-			tav_dict.target = flt(ccd.budget_amount) * month_percentage / 100
+		distribution = tdd.get(ccd.monthly_distribution, {}) if ccd.monthly_distribution else None
+		for month, position in month_position.items():
+			month_percentage = distribution.get(month, 0) if distribution is not None else 100.0 / 12
+			target[base + position] = flt(ccd.budget_amount) * month_percentage / 100
 
-			for ad in actual_details.get(ccd.account, []):
-				if ad.month_name == month and ad.fiscal_year == ccd.fiscal_year:
-					tav_dict.actual += flt(ad.debit) - flt(ad.credit)
+	for d in get_actual_details(filters, dimension_target_details):
+		base = offset(d.budget_against, d.account, d.fiscal_year)
+		if base in budgeted:
+			actual[base + month_position[MONTHS[d.month_id - 1]]] = flt(d.amount)
 
-	return cam_map
+	return frappe._dict(pairs=pairs, years=years, target=target, actual=actual)
 
 
 def get_fiscal_years(filters):
@@ -362,13 +458,11 @@ def get_chart_data(filters, columns, data):
 
 	budget_values, actual_values = [0] * no_of_columns, [0] * no_of_columns
 	for d in data:
-		values = d[2:]
-		index = 0
-
-		for i in range(no_of_columns):
-			budget_values[i] += values[index]
-			actual_values[i] += values[index + 1]
-			index += 3
+		# each period contributes a (budget, actual, variance) triple after the two key columns
+		for i, value in enumerate(d[2 : 2 + 3 * no_of_columns : 3]):
+			budget_values[i] += value
+		for i, value in enumerate(d[3 : 3 + 3 * no_of_columns : 3]):
+			actual_values[i] += value
 
 	return {
 		"data": {
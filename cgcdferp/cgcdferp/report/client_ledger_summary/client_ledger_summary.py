@@ -1,11 +1,14 @@
 # Copyright (c) 2025, Farhan and contributors
 # For license information, please see license.txt
 
+from itertools import islice
 
 import frappe
-from frappe import _, qb, scrub
+from frappe import _, scrub
 from frappe.utils import getdate, nowdate
 
+GL_BATCH_SIZE = 2000
+
 
 class PartyLedgerSummaryReport:
 	def __init__(self, filters=None):
@@ -23,50 +26,13 @@ class PartyLedgerSummaryReport:
 		self.filters.party_type = args.get("party_type")
 		self.party_naming_by = frappe.db.get_value(args.get("naming_by")[0], None, args.get("naming_by")[1])
 
-		self.get_gl_entries()
-		self.get_additional_columns()
-		self.get_return_invoices()
 		self.get_party_adjustment_amounts()
 
 		columns = self.get_columns()
+		# runs last: party totals are streamed, and no other query may use the connection meanwhile
 		data = self.get_data()
 		return columns, data
 
-	def get_additional_columns(self):
-		"""
-		Additional Columns for 'User Permission' based access control
-		"""
-
-		if self.filters.party_type == "Customer":
-			self.territories = frappe._dict({})
-			self.customer_group = frappe._dict({})
-
-			customer = qb.DocType("Customer")
-			result = (
-				frappe.qb.from_(customer)
-				.select(
-					customer.name, customer.territory, customer.customer_group, customer.default_sales_partner
-				)
-				.where(customer.disabled == 0)
-				.run(as_dict=True)
-			)
-
-			for x in result:
-				self.territories[x.name] = x.territory
-				self.customer_group[x.name] = x.customer_group
-		else:
-			self.supplier_group = frappe._dict({})
-			supplier = qb.DocType("Supplier")
-			result = (
-				frappe.qb.from_(supplier)
-				.select(supplier.name, supplier.supplier_group)
-				.where(supplier.disabled == 0)
-				.run(as_dict=True)
-			)
-
-			for x in result:
-				self.supplier_group[x.name] = x.supplier_group
-
 	def get_columns(self):
 		columns = [
 			{
@@ -183,51 +149,30 @@ class PartyLedgerSummaryReport:
 
 	def get_data(self):
 		company_currency = frappe.get_cached_value("Company", self.filters.get("company"), "default_currency")
-		invoice_dr_or_cr = "debit" if self.filters.party_type == "Customer" else "credit"
-		reverse_dr_or_cr = "credit" if self.filters.party_type == "Customer" else "debit"
 
-		self.party_data = frappe._dict({})
-		for gle in self.gl_entries:
-			self.party_data.setdefault(
-				gle.party,
-				frappe._dict(
-					{
-						"party": gle.party,
-						"party_name": gle.party_name,
-						"opening_balance": 0,
-						"invoiced_amount": 0,
-						"paid_amount": 0,
-						"return_amount": 0,
-						"closing_balance": 0,
-						"currency": company_currency,
-					}
-				),
+		out = []
+		# party totals arrive one row per party, so each row is finished as soon as it is read
+		for totals in self.iter_party_totals():
+			row = frappe._dict(
+				{
+					"party": totals.party,
+					"party_name": totals.party_name,
+					"opening_balance": totals.opening_balance,
+					"invoiced_amount": totals.invoiced_amount,
+					"paid_amount": totals.paid_amount,
+					"return_amount": totals.return_amount,
+					"closing_balance": totals.closing_balance,
+					"currency": company_currency,
+				}
 			)
 
+			# Additional Columns for 'User Permission' based access control
 			if self.filters.party_type == "Customer":
-				self.party_data[gle.party].update({"territory": self.territories.get(gle.party)})
-				self.party_data[gle.party].update({"customer_group": self.customer_group.get(gle.party)})
+				row.update({"territory": totals.territory})
+				row.update({"customer_group": totals.customer_group})
 			else:
-				self.party_data[gle.party].update({"supplier_group": self.supplier_group.get(gle.party)})
-
-			amount = gle.get(invoice_dr_or_cr) - gle.get(reverse_dr_or_cr)
-			self.party_data[gle.party].closing_balance += amount
-
-			# Use delivery_date instead of posting_date for Sales Invoices
-			reference_date = gle.delivery_date if gle.delivery_date else gle.posting_date
+				row.update({"supplier_group": totals.supplier_group})
 
-			if reference_date < self.filters.from_date or gle.is_opening == "Yes":
-				self.party_data[gle.party].opening_balance += amount
-			else:
-				if amount > 0:
-					self.party_data[gle.party].invoiced_amount += amount
-				elif gle.voucher_no in self.return_invoices:
-					self.party_data[gle.party].return_amount -= amount
-				else:
-					self.party_data[gle.party].paid_amount -= amount
-
-		out = []
-		for party, row in self.party_data.items():
 			if (
 				row.opening_balance
 				or row.invoiced_amount
@@ -236,11 +181,11 @@ class PartyLedgerSummaryReport:
 				or row.closing_balance
 			):
 				total_party_adjustment = sum(
-					amount for amount in self.party_adjustment_details.get(party, {}).values()
+					amount for amount in self.party_adjustment_details.get(totals.party, {}).values()
 				)
 				row.paid_amount -= total_party_adjustment
 
-				adjustments = self.party_adjustment_details.get(party, {})
+				adjustments = self.party_adjustment_details.get(totals.party, {})
 				for account in self.party_adjustment_accounts:
 					row["adj_" + scrub(account)] = adjustments.get(account, 0)
 
@@ -248,58 +193,81 @@ class PartyLedgerSummaryReport:
 
 		return out
 
-	def get_gl_entries(self):
-		conditions = self.prepare_conditions()
-		join = join_field = ""
-		delivery_date_join = ""
-		delivery_date_field = ""
-		
+	def get_gl_query_parts(self):
+		"""Joins, party fields and reference date expression shared by the party GL queries"""
+		invoice_dr_or_cr = "debit" if self.filters.party_type == "Customer" else "credit"
+		reverse_dr_or_cr = "credit" if self.filters.party_type == "Customer" else "debit"
+
 		if self.filters.party_type == "Customer":
-			join_field = ", p.customer_name as party_name"
+			join_field = "p.customer_name"
+			# attributes of enabled parties only, as the permission columns always were
+			party_fields = """max(case when p.disabled = 0 then p.territory end) as territory,
+				max(case when p.disabled = 0 then p.customer_group end) as customer_group"""
 			join = "left join `tabCustomer` p on gle.party = p.name"
-			# Add join with Sales Invoice to get delivery_date
-			delivery_date_join = "left join `tabSales Invoice` si on gle.voucher_type = 'Sales Invoice' and gle.voucher_no = si.name"
-			delivery_date_field = ", si.delivery_date"
-		elif self.filters.party_type == "Supplier":
-			join_field = ", p.supplier_name as party_name"
+			# Use delivery_date instead of posting_date for Sales Invoices
+			join += " left join `tabSales Invoice` si on gle.voucher_type = 'Sales Invoice' and gle.voucher_no = si.name"
+			reference_date = "ifnull(si.delivery_date, gle.posting_date)"
+			# returns in the period are classified by their delivery date; 0 for rows without an invoice
+			is_return = """(case when si.is_return = 1 and si.docstatus = 1
+				and si.delivery_date between %(from_date)s and %(to_date)s then 1 else 0 end)"""
+		else:
+			join_field = "p.supplier_name"
+			party_fields = "max(case when p.disabled = 0 then p.supplier_group end) as supplier_group"
 			join = "left join `tabSupplier` p on gle.party = p.name"
-			delivery_date_field = ", null as delivery_date"
+			join += " left join `tabPurchase Invoice` pi on gle.voucher_type = 'Purchase Invoice' and gle.voucher_no = pi.name"
+			reference_date = "gle.posting_date"
+			is_return = """(case when pi.is_return = 1 and pi.docstatus = 1
+				and pi.posting_date between %(from_date)s and %(to_date)s then 1 else 0 end)"""
+
+		return frappe._dict(
+			join=join,
+			join_field=join_field,
+			party_fields=party_fields,
+			reference_date=reference_date,
+			is_return=is_return,
+			amount=f"(gle.{invoice_dr_or_cr} - gle.{reverse_dr_or_cr})",
+			is_opening=f"({reference_date} < %(from_date)s or gle.is_opening = 'Yes')",
+		)
+
+	def iter_party_totals(self):
+		"""Opening, invoiced, paid, returned and closing amounts per party, summed in the database"""
+		return iter_gl_rows(*self.get_party_totals_query())
+
+	def get_party_totals_query(self):
+		conditions = self.prepare_conditions()
+		q = self.get_gl_query_parts()
 
-		self.gl_entries = frappe.db.sql(
+		return (
 			f"""
 			select
-				gle.posting_date, gle.party, gle.voucher_type, gle.voucher_no, gle.against_voucher_type,
-				gle.against_voucher, gle.debit, gle.credit, gle.is_opening {join_field} {delivery_date_field}
+				gle.party, max({q.join_field}) as party_name, {q.party_fields},
+				sum({q.amount}) as closing_balance,
+				sum(case when {q.is_opening} then {q.amount} else 0 end) as opening_balance,
+				sum(case when not {q.is_opening} and {q.amount} > 0 then {q.amount} else 0 end) as invoiced_amount,
+				-sum(case when not {q.is_opening} and {q.amount} < 0 and {q.is_return} = 0 then {q.amount} else 0 end) as paid_amount,
+				-sum(case when not {q.is_opening} and {q.amount} < 0 and {q.is_return} = 1 then {q.amount} else 0 end) as return_amount
 			from `tabGL Entry` gle
-			{join}
-			{delivery_date_join}
+			{q.join}
 			where
 				gle.docstatus < 2 and gle.is_cancelled = 0 and gle.party_type=%(party_type)s and ifnull(gle.party, '') != ''
-				and (
-					(gle.voucher_type = 'Sales Invoice' and ifnull(si.delivery_date, gle.posting_date) <= %(to_date)s)
-					or (gle.voucher_type != 'Sales Invoice' and gle.posting_date <= %(to_date)s)
-				) {conditions}
-			order by 
-				case 
-					when gle.voucher_type = 'Sales Invoice' then ifnull(si.delivery_date, gle.posting_date)
-					else gle.posting_date
-				end
+				and {q.reference_date} <= %(to_date)s {conditions}
+			group by gle.party
+			order by gle.party
 		""",
 			self.filters,
-			as_dict=True,
 		)
 
-	def prepare_conditions(self):
+	def prepare_conditions(self, alias="gle"):
 		conditions = [""]
 
 		if self.filters.company:
-			conditions.append("gle.company=%(company)s")
+			conditions.append(f"{alias}.company=%(company)s")
 
 		if self.filters.finance_book:
-			conditions.append("ifnull(finance_book,'') in (%(finance_book)s, '')")
+			conditions.append(f"ifnull({alias}.finance_book,'') in (%(finance_book)s, '')")
 
 		if self.filters.get("party"):
-			conditions.append("party=%(party)s")
+			conditions.append(f"{alias}.party=%(party)s")
 
 		if self.filters.party_type == "Customer":
 			if self.filters.get("customer_group"):
@@ -308,7 +276,7 @@ class PartyLedgerSummaryReport:
 				)
 
 				conditions.append(
-					f"""party in (select name from tabCustomer
+					f"""{alias}.party in (select name from tabCustomer
 					where exists(select name from `tabCustomer Group` where lft >= {lft} and rgt <= {rgt}
 						and name=tabCustomer.customer_group))"""
 				)
@@ -317,19 +285,19 @@ class PartyLedgerSummaryReport:
 				lft, rgt = frappe.db.get_value("Territory", self.filters.get("territory"), ["lft", "rgt"])
 
 				conditions.append(
-					f"""party in (select name from tabCustomer
+					f"""{alias}.party in (select name from tabCustomer
 					where exists(select name from `tabTerritory` where lft >= {lft} and rgt <= {rgt}
 						and name=tabCustomer.territory))"""
 				)
 
 			if self.filters.get("payment_terms_template"):
 				conditions.append(
-					"party in (select name from tabCustomer where payment_terms=%(payment_terms_template)s)"
+					f"{alias}.party in (select name from tabCustomer where payment_terms=%(payment_terms_template)s)"
 				)
 
 			if self.filters.get("sales_partner"):
 				conditions.append(
-					"party in (select name from tabCustomer where default_sales_partner=%(sales_partner)s)"
+					f"{alias}.party in (select name from tabCustomer where default_sales_partner=%(sales_partner)s)"
 				)
 
 			if self.filters.get("sales_person"):
@@ -338,147 +306,137 @@ class PartyLedgerSummaryReport:
 				)
 
 				conditions.append(
-					"""exists(select name from `tabSales Team` steam where
-					steam.sales_person in (select name from `tabSales Person` where lft >= {} and rgt <= {})
-					and ((steam.parent = voucher_no and steam.parenttype = voucher_type)
-						or (steam.parent = against_voucher and steam.parenttype = against_voucher_type)
-						or (steam.parent = party and steam.parenttype = 'Customer')))""".format(lft, rgt)
+					f"""exists(select name from `tabSales Team` steam where
+					steam.sales_person in (select name from `tabSales Person` where lft >= {lft} and rgt <= {rgt})
+					and ((steam.parent = {alias}.voucher_no and steam.parenttype = {alias}.voucher_type)
+						or (steam.parent = {alias}.against_voucher and steam.parenttype = {alias}.against_voucher_type)
+						or (steam.parent = {alias}.party and steam.parenttype = 'Customer')))"""
 				)
 
 		if self.filters.party_type == "Supplier":
 			if self.filters.get("supplier_group"):
 				conditions.append(
-					"""party in (select name from tabSupplier
+					f"""{alias}.party in (select name from tabSupplier
 					where supplier_group=%(supplier_group)s)"""
 				)
 
 		return " and ".join(conditions)
 
-	def get_return_invoices(self):
-		doctype = "Sales Invoice" if self.filters.party_type == "Customer" else "Purchase Invoice"
-		
-		if self.filters.party_type == "Customer":
-			# For Customer: Use delivery_date for filtering return invoices
-			self.return_invoices = [
-				d.name
-				for d in frappe.get_all(
-					doctype,
-					filters={
-						"is_return": 1,
-						"docstatus": 1,
-						"delivery_date": ["between", [self.filters.from_date, self.filters.to_date]],
-					},
-				)
-			]
-		else:
-			# For Supplier: Keep using posting_date as Purchase Invoice doesn't have delivery_date
-			self.return_invoices = [
-				d.name
-				for d in frappe.get_all(
-					doctype,
-					filters={
-						"is_return": 1,
-						"docstatus": 1,
-						"posting_date": ["between", [self.filters.from_date, self.filters.to_date]],
-					},
-				)
-			]
-
 	def get_party_adjustment_amounts(self):
-		conditions = self.prepare_conditions()
 		account_type = "Expense Account" if self.filters.party_type == "Customer" else "Income Account"
-		income_or_expense_accounts = frappe.db.get_all(
-			"Account", filters={"account_type": account_type, "company": self.filters.company}, pluck="name"
+		# looked up while the GL cursor is open, so every account type is loaded up front
+		account_types = dict(
+			frappe.db.get_all(
+				"Account", filters={"company": self.filters.company}, fields=["name", "account_type"], as_list=True
+			)
 		)
-		invoice_dr_or_cr = "debit" if self.filters.party_type == "Customer" else "credit"
-		reverse_dr_or_cr = "credit" if self.filters.party_type == "Customer" else "debit"
+		income_or_expense_accounts = [
+			account for account, type_of_account in account_types.items() if type_of_account == account_type
+		]
 		round_off_account = frappe.get_cached_value("Company", self.filters.company, "round_off_account")
 
-		gl = qb.DocType("GL Entry")
+		gl_entries = iter_gl_rows(*self.get_adjustment_entries_query(income_or_expense_accounts))
+
+		self.party_adjustment_details = {}
+		self.party_adjustment_accounts = set()
+
+		# entries are ordered by voucher, so each voucher is settled as soon as the next one starts
+		voucher, voucher_gl_entries = None, []
+		for gle in gl_entries:
+			if (gle.voucher_type, gle.voucher_no) != voucher:
+				self.allocate_voucher_adjustments(voucher_gl_entries, account_types, account_type, round_off_account)
+				voucher, voucher_gl_entries = (gle.voucher_type, gle.voucher_no), []
+			voucher_gl_entries.append(gle)
+
+		self.allocate_voucher_adjustments(voucher_gl_entries, account_types, account_type, round_off_account)
+
+	def get_adjustment_entries_query(self, income_or_expense_accounts):
+		"""Income or expense entries of the vouchers that touch a party in the period"""
+		conditions = self.prepare_conditions(alias="gle2")
+		income_or_expense_accounts = list(income_or_expense_accounts)
+
 		if not income_or_expense_accounts:
 			# prevent empty 'in' condition
 			income_or_expense_accounts.append("")
 
-		# Build the accounts condition string
-		accounts_condition = "(" + ",".join([f"'{account}'" for account in income_or_expense_accounts]) + ")"
-
-		# Modified query to use delivery_date for Sales Invoice entries
+		# Use delivery_date instead of posting_date for Sales Invoice entries
 		if self.filters.party_type == "Customer":
-			date_condition = """
-				and (
-					(gle.voucher_type = 'Sales Invoice' and ifnull(
-						(select si.delivery_date from `tabSales Invoice` si where si.name = gle.voucher_no), 
-						gle.posting_date
-					) between %(from_date)s and %(to_date)s)
-					or (gle.voucher_type != 'Sales Invoice' and gle.posting_date between %(from_date)s and %(to_date)s)
-				)
-			"""
+			delivery_date_join = "left join `tabSales Invoice` si on gle.voucher_type = 'Sales Invoice' and gle.voucher_no = si.name"
+			reference_date = "ifnull(si.delivery_date, gle.posting_date)"
 		else:
-			date_condition = "and gle.posting_date between %(from_date)s and %(to_date)s"
+			delivery_date_join = ""
+			reference_date = "gle.posting_date"
 
-		gl_entries = frappe.db.sql( 
+		# qualifying vouchers are collected once and joined, instead of a tuple IN subquery per entry
+		return (
 			f"""
+			with party_vouchers as (
+				select distinct gle2.voucher_type, gle2.voucher_no from `tabGL Entry` gle2
+				left join `tabSales Invoice` si on gle2.voucher_type = 'Sales Invoice' and gle2.voucher_no = si.name
+				where gle2.party_type=%(party_type)s and ifnull(gle2.party, '') != ''
+				and (
+					(gle2.voucher_type = 'Sales Invoice' and ifnull(si.delivery_date, gle2.posting_date) between %(from_date)s and %(to_date)s)
+					or (gle2.voucher_type != 'Sales Invoice' and gle2.posting_date between %(from_date)s and %(to_date)s)
+				) and gle2.docstatus < 2 {conditions}
+			)
 			select
 				gle.posting_date, gle.account, gle.party, gle.voucher_type, gle.voucher_no, gle.debit, gle.credit
 			from
-				`tabGL Entry` gle
+				party_vouchers pv
+				join `tabGL Entry` gle on gle.voucher_type = pv.voucher_type and gle.voucher_no = pv.voucher_no
+				{delivery_date_join}
 			where
 				gle.docstatus < 2 and gle.is_cancelled = 0
-				and gle.account in {accounts_condition}
-				{date_condition}
-				and (gle.voucher_type, gle.voucher_no) in (
-					select gle2.voucher_type, gle2.voucher_no from `tabGL Entry` gle2
-					left join `tabSales Invoice` si on gle2.voucher_type = 'Sales Invoice' and gle2.voucher_no = si.name
-					where gle2.party_type=%(party_type)s and ifnull(gle2.party, '') != ''
-					and (
-						(gle2.voucher_type = 'Sales Invoice' and ifnull(si.delivery_date, gle2.posting_date) between %(from_date)s and %(to_date)s)
-						or (gle2.voucher_type != 'Sales Invoice' and gle2.posting_date between %(from_date)s and %(to_date)s)
-					) and gle2.docstatus < 2 {conditions}
-				)
+				and gle.account in %(income_or_expense_accounts)s
+				and {reference_date} between %(from_date)s and %(to_date)s
+			order by gle.voucher_type, gle.voucher_no
 			""",
-			self.filters,
-			as_dict=True,
+			dict(self.filters, income_or_expense_accounts=income_or_expense_accounts),
 		)
 
-		self.party_adjustment_details = {}
-		self.party_adjustment_accounts = set()
-		adjustment_voucher_entries = {}
-		for gle in gl_entries:
-			adjustment_voucher_entries.setdefault((gle.voucher_type, gle.voucher_no), [])
-			adjustment_voucher_entries[(gle.voucher_type, gle.voucher_no)].append(gle)
-
-		for voucher_gl_entries in adjustment_voucher_entries.values():
-			parties = {}
-			accounts = {}
-			has_irrelevant_entry = False
-
-			for gle in voucher_gl_entries:
-				if gle.account == round_off_account:
-					continue
-				elif gle.party:
-					parties.setdefault(gle.party, 0)
-					parties[gle.party] += gle.get(reverse_dr_or_cr) - gle.get(invoice_dr_or_cr)
-				elif frappe.get_cached_value("Account", gle.account, "account_type") == account_type:
-					accounts.setdefault(gle.account, 0)
-					accounts[gle.account] += gle.get(invoice_dr_or_cr) - gle.get(reverse_dr_or_cr)
-				else:
-					has_irrelevant_entry = True
-
-			if parties and accounts:
-				if len(parties) == 1:
-					party = next(iter(parties.keys()))
-					for account, amount in accounts.items():
-						self.party_adjustment_accounts.add(account)
-						self.party_adjustment_details.setdefault(party, {})
-						self.party_adjustment_details[party].setdefault(account, 0)
-						self.party_adjustment_details[party][account] += amount
-				elif len(accounts) == 1 and not has_irrelevant_entry:
-					account = next(iter(accounts.keys()))
+	def allocate_voucher_adjustments(self, voucher_gl_entries, account_types, account_type, round_off_account):
+		invoice_dr_or_cr = "debit" if self.filters.party_type == "Customer" else "credit"
+		reverse_dr_or_cr = "credit" if self.filters.party_type == "Customer" else "debit"
+
+		parties = {}
+		accounts = {}
+		has_irrelevant_entry = False
+
+		for gle in voucher_gl_entries:
+			if gle.account == round_off_account:
+				continue
+			elif gle.party:
+				parties.setdefault(gle.party, 0)
+				parties[gle.party] += gle.get(reverse_dr_or_cr) - gle.get(invoice_dr_or_cr)
+			elif account_types.get(gle.account) == account_type:
+				accounts.setdefault(gle.account, 0)
+				accounts[gle.account] += gle.get(invoice_dr_or_cr) - gle.get(reverse_dr_or_cr)
+			else:
+				has_irrelevant_entry = True
+
+		if parties and accounts:
+			if len(parties) == 1:
+				party = next(iter(parties.keys()))
+				for account, amount in accounts.items():
 					self.party_adjustment_accounts.add(account)
-					for party, amount in parties.items():
-						self.party_adjustment_details.setdefault(party, {})
-						self.party_adjustment_details[party].setdefault(account, 0)
-						self.party_adjustment_details[party][account] += amount
+					self.party_adjustment_details.setdefault(party, {})
+					self.party_adjustment_details[party].setdefault(account, 0)
+					self.party_adjustment_details[party][account] += amount
+			elif len(accounts) == 1 and not has_irrelevant_entry:
+				account = next(iter(accounts.keys()))
+				self.party_adjustment_accounts.add(account)
+				for party, amount in parties.items():
+					self.party_adjustment_details.setdefault(party, {})
+					self.party_adjustment_details[party].setdefault(account, 0)
+					self.party_adjustment_details[party][account] += amount
+
+
+def iter_gl_rows(query, values, batch_size=GL_BATCH_SIZE):
+	"""Rows of `query` as dicts, read through an unbuffered cursor `batch_size` rows at a time"""
+	with frappe.db.unbuffered_cursor():
+		rows = frappe.db.sql(query, values, as_dict=True, as_iterator=True)
+		while batch := list(islice(rows, batch_size)):
+			yield from batch
 
 
 def execute(filters=None):
@@ -0,0 +1,70 @@
+# Copyright (c) 2025, Farhan and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cgcdferp.cgcdferp.report.client_ledger_summary.client_ledger_summary import execute
+
+COMPANY = "_Test Company"
+CUSTOMER = "_Test Ledger Summary Customer"
+RECEIVABLE = "Debtors - _TC"
+
+
+class TestClientLedgerSummary(FrappeTestCase):
+	def make_sales_invoice(self, name, is_return=0, delivery_date="2026-01-05"):
+		frappe.get_doc(
+			{
+				"doctype": "Sales Invoice",
+				"name": name,
+				"company": COMPANY,
+				"customer": CUSTOMER,
+				"posting_date": "2026-01-05",
+				"delivery_date": delivery_date,
+				"is_return": is_return,
+				"docstatus": 1,
+			}
+		).db_insert()
+
+	def make_gl_entry(self, voucher_type, voucher_no, debit=0, credit=0):
+		frappe.get_doc(
+			{
+				"doctype": "GL Entry",
+				"name": frappe.generate_hash(length=10),
+				"company": COMPANY,
+				"posting_date": "2026-01-05",
+				"account": RECEIVABLE,
+				"party_type": "Customer",
+				"party": CUSTOMER,
+				"voucher_type": voucher_type,
+				"voucher_no": voucher_no,
+				"debit": debit,
+				"credit": credit,
+				"is_opening": "No",
+				"is_cancelled": 0,
+				"docstatus": 1,
+			}
+		).db_insert()
+
+	def test_paid_and_return_amounts_of_a_mixed_ledger(self):
+		self.make_sales_invoice("_T-CLS-INV")
+		self.make_sales_invoice("_T-CLS-RET", is_return=1)
+		# a return without a delivery date is not in the period, so it counts as paid
+		self.make_sales_invoice("_T-CLS-RET-UNDATED", is_return=1, delivery_date=None)
+
+		self.make_gl_entry("Sales Invoice", "_T-CLS-INV", debit=100)
+		self.make_gl_entry("Payment Entry", "_T-CLS-PAY", credit=60)
+		self.make_gl_entry("Journal Entry", "_T-CLS-JV", credit=5)
+		self.make_gl_entry("Sales Invoice", "_T-CLS-RET", credit=10)
+		self.make_gl_entry("Sales Invoice", "_T-CLS-RET-UNDATED", credit=3)
+
+		_columns, data = execute(
+			{"company": COMPANY, "party": CUSTOMER, "from_date": "2026-01-01", "to_date": "2026-01-31"}
+		)
+
+		self.assertEqual(len(data), 1)
+		row = data[0]
+		self.assertEqual(row.invoiced_amount, 100)
+		self.assertEqual(row.paid_amount, 68)
+		self.assertEqual(row.return_amount, 10)
+		self.assertEqual(row.closing_balance, 22)
@@ -0,0 +1,69 @@
+import frappe
+
+TREE_INDEX_CACHE_KEY = "capital_budget_tree_index"
+# bounds staleness for tree doctypes without a clear_tree_index hook, e.g. accounting dimensions
+TREE_INDEX_TTL = 600
+
+def _build_tree_index(doctype):
+    """Ancestor and descendant lists (each including the node itself) for every node of `doctype`"""
+    ancestors, descendants = {}, {}
+    stack = []
+
+    for name, lft, rgt in frappe.db.sql(
+        f"select name, lft, rgt from `tab{doctype}` order by lft"  # nosec
+    ):
+        while stack and stack[-1][1] < lft:
+            stack.pop()
+
+        ancestors[name] = [node for node, _rgt in stack] + [name]
+        descendants[name] = [name]
+        for node, _rgt in stack:
+            descendants[node].append(name)
+
+        stack.append((name, rgt))
+
+    return {"ancestors": ancestors, "descendants": descendants}
+
+def get_tree_index(doctype):
+    key = f"{TREE_INDEX_CACHE_KEY}::{doctype}"
+    index = frappe.cache.get_value(key)
+    if index is None:
+        index = _build_tree_index(doctype)
+        frappe.cache.set_value(key, index, expires_in_sec=TREE_INDEX_TTL)
+    return index
+
+def _get_nested_set_nodes(doctype, name, ancestors):
+    """Same lists read from lft/rgt, for nodes created or renamed since the index was built"""
+    bounds = frappe.db.get_value(doctype, name, ["lft", "rgt"])
+    if not bounds:
+        return []
+
+    condition = "lft <= %s and rgt >= %s" if ancestors else "lft >= %s and rgt <= %s"
+    return frappe.db.sql_list(
+        f"select name from `tab{doctype}` where {condition} order by lft", bounds  # nosec
+    )
+
+def get_ancestors(doctype, name):
+    """`name` and every node above it; empty if `name` is not in the tree"""
+    nodes = get_tree_index(doctype)["ancestors"].get(name)
+    if nodes is None:
+        nodes = _get_nested_set_nodes(doctype, name, ancestors=True)
+    return nodes
+
+def get_descendants(doctype, name):
+    """`name` and every node below it; empty if `name` is not in the tree"""
+    nodes = get_tree_index(doctype)["descendants"].get(name)
+    if nodes is None:
+        nodes = _get_nested_set_nodes(doctype, name, ancestors=False)
+    return nodes
+
+def _delete_tree_index(doctype):
+    frappe.cache.delete_value(f"{TREE_INDEX_CACHE_KEY}::{doctype}")
+
+def clear_tree_index(doc, method=None, *args):
+    """on_update / on_trash / after_rename of the tree doctypes budgets are set against
+
+    Cleared again after commit, so an index rebuilt from the old data meanwhile does not stick.
+    """
+    _delete_tree_index(doc.doctype)
+    frappe.db.after_commit.add(lambda: _delete_tree_index(doc.doctype))
@@ -0,0 +1,73 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-budget-utilization")
+@click.option("--company", help="Only rebuild the ledger of this company")
+@pass_context
+def rebuild_budget_utilization(context, company=None):
+	"Recompute the Capital Budget Utilization ledger from submitted documents"
+	from cgcdferp.cgcdferp.asset_account_validator import rebuild_budget_utilization
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		rebuild_budget_utilization(company)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+
+@click.command("rebuild-budget-actuals")
+@click.option("--company", help="Only rebuild actuals of this company")
+@click.option("--fiscal-year", help="Only rebuild actuals of this fiscal year")
+@pass_context
+def rebuild_budget_actuals(context, company=None, fiscal_year=None):
+	"Recompute Capital Budget Monthly Actual from GL Entry"
+	from cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual import (
+		rebuild_monthly_actuals,
+	)
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		rebuild_monthly_actuals(company, fiscal_year)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+
+@click.command("explain-budget-queries")
+@click.option("--company", help="Company to take sample budget lines from")
+@pass_context
+def explain_budget_queries(context, company=None):
+	"Print EXPLAIN plans for the Capital Budget check and report queries"
+	from cgcdferp.cgcdferp.query_plans import get_query_plans
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		company = company or frappe.db.get_single_value("Global Defaults", "default_company")
+		for d in get_query_plans(company):
+			click.secho(f"-- {d['source']}", fg="yellow")
+			click.echo(d["query"])
+			for row in d["plan"]:
+				click.echo(
+					"  {table}: type={type} key={key} rows={rows} {extra}".format(
+						table=row.get("table"),
+						type=row.get("type"),
+						key=row.get("key"),
+						rows=row.get("rows"),
+						extra=row.get("Extra") or "",
+					)
+				)
+			click.echo()
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_budget_utilization, rebuild_budget_actuals, explain_budget_queries]
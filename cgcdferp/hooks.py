@@ -47,10 +47,11 @@ app_license = "mit"
 
 doctype_js = {
     "Item" : "public/js/fixed_item.js",
-    # "Material Request" : "public/js/check_budget.js",
-    # "Purchase Order" : "/public/js/po_budget.js", 
-    # "Journal Entry" : "/public/js/jv_budget.js", 
-    # "Purchase Invoice" : "public/js/pi_budget.js",
+    "Material Request" : ["public/js/budget_headroom.js", "public/js/budget_summary.js", "public/js/check_budget.js"],
+    "Purchase Order" : ["public/js/budget_headroom.js", "public/js/budget_summary.js", "public/js/po_budget.js"],
+    "Purchase Invoice" : ["public/js/budget_headroom.js", "public/js/budget_summary.js", "public/js/pi_budget.js"],
+    "Purchase Receipt" : ["public/js/budget_summary.js", "public/js/pr_budget.js"],
+    "Stock Entry" : ["public/js/budget_summary.js", "public/js/se_budget.js"],
 }
 # doctype_list_js = {"doctype" : "public/js/doctype_list.js"}
 # doctype_tree_js = {"doctype" : "public/js/doctype_tree.js"}
@@ -154,41 +155,107 @@ doctype_js = {
 # }
 
 doc_events = {
+    "Cost Center": {
+        "on_update": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+        "on_trash": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+        "after_rename": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+    },
+    "Department": {
+        "on_update": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+        "on_trash": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+        "after_rename": "cgcdferp.cgcdferp.tree_index.clear_tree_index",
+    },
+    "GL Entry": {
+        "on_submit": [
+            "cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual.update_monthly_actuals",
+            "cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.invalidate_prepared_reports",
+        ],
+        "on_cancel": [
+            "cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual.update_monthly_actuals",
+            "cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.invalidate_prepared_reports",
+        ],
+    },
+    "Capital Budget": {
+        "on_submit": "cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.invalidate_prepared_reports",
+        "on_cancel": "cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.invalidate_prepared_reports",
+        "on_update_after_submit": "cgcdferp.cgcdferp.report.capital_budget_variance_report.capital_budget_variance_report.invalidate_prepared_reports",
+    },
+    "Monthly Distribution": {
+        "on_update": "cgcdferp.cgcdferp.doctype.capital_budget.capital_budget.clear_distribution_curves",
+        "on_trash": "cgcdferp.cgcdferp.doctype.capital_budget.capital_budget.clear_distribution_curves",
+    },
+    "Fiscal Year": {
+        "on_update": "cgcdferp.cgcdferp.doctype.capital_budget.capital_budget.clear_distribution_curves",
+    },
+
     # Purchasing flow
     "Purchase Order": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Purchase Invoice": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Material Request": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Purchase Receipt": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
 
     # Expenses flow
     "Expense Claim": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Payment Entry": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Journal Entry": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Landed Cost Voucher": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Asset": {   # depreciation
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Stock Entry": {  # material issue
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
     "Payroll Entry": {
-        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget"
+        "before_submit": "cgcdferp.cgcdferp.asset_account_validator.validate_budget",
+        "on_submit": "cgcdferp.cgcdferp.asset_account_validator.post_budget_utilization",
+        "on_cancel": "cgcdferp.cgcdferp.asset_account_validator.reverse_budget_utilization",
+        "on_update_after_submit": "cgcdferp.cgcdferp.asset_account_validator.repost_budget_utilization",
     },
 }
 
@@ -196,6 +263,12 @@ doc_events = {
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+    "daily_long": [
+        "cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual.reconcile_monthly_actuals",
+    ],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"cgcdferp.tasks.all"
@@ -0,0 +1,23 @@
+import frappe
+
+# (doctype, columns, index name) for the filters of queries captured by explain-budget-queries;
+# GL Entry indexes slow every GL write, so only those a captured query reads are added
+INDEXES = [
+	("GL Entry", ["party_type", "party", "posting_date"], "party_type_party_posting_date_index"),
+	("Budget Account", ["account", "parent"], "account_parent_index"),
+	("Capital Budget", ["company", "fiscal_year", "docstatus"], "company_fiscal_year_docstatus_index"),
+	("Material Request Item", ["item_code", "expense_account"], "item_code_expense_account_index"),
+	("Purchase Order Item", ["item_code", "expense_account"], "item_code_expense_account_index"),
+]
+
+# budget dimensions the variance report groups GL Entry by, indexed when the column exists
+DIMENSION_COLUMNS = ["cost_center", "project", "department"]
+
+
+def execute():
+	for doctype, columns, index_name in INDEXES:
+		frappe.db.add_index(doctype, columns, index_name)
+
+	for column in DIMENSION_COLUMNS:
+		if frappe.db.has_column("GL Entry", column):
+			frappe.db.add_index("GL Entry", ["account", "fiscal_year", column], f"account_fiscal_year_{column}_index")
@@ -0,0 +1,7 @@
+from cgcdferp.cgcdferp.doctype.capital_budget_monthly_actual.capital_budget_monthly_actual import (
+	rebuild_monthly_actuals,
+)
+
+
+def execute():
+	rebuild_monthly_actuals()
@@ -0,0 +1,5 @@
+from cgcdferp.cgcdferp.asset_account_validator import rebuild_budget_utilization
+
+
+def execute():
+	rebuild_budget_utilization()
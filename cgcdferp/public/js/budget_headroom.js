@@ -0,0 +1,86 @@
+frappe.provide("cgcdferp.budget");
+
+// Fields of a transaction that can move an account onto another budget line
+cgcdferp.budget.headroom_fields = [
+    "item_code", "amount", "expense_account", "custom_fixed_asset_amount", "fixed_asset_account",
+    "cost_center", "project", "department"
+];
+
+cgcdferp.budget.refresh_headroom = function(frm) {
+    if (!frm.__refresh_budget_headroom) {
+        // typing in the grid fires many events; only ask the server once things settle
+        frm.__refresh_budget_headroom = frappe.utils.debounce(() => cgcdferp.budget.render_headroom(frm), 600);
+    }
+    frm.__refresh_budget_headroom();
+};
+
+cgcdferp.budget.render_headroom = function(frm) {
+    if (frm.__budget_headroom_section) {
+        frm.__budget_headroom_section.remove();
+        frm.__budget_headroom_section = null;
+    }
+
+    if (frm.doc.docstatus !== 0 || !frm.doc.company || !(frm.doc.items || []).length) {
+        return;
+    }
+    if (frm.doctype === "Material Request" && frm.doc.material_request_type !== "Purchase") {
+        return;
+    }
+
+    frappe.call({
+        method: "cgcdferp.cgcdferp.asset_account_validator.get_budget_headroom",
+        args: { doc: frm.doc }
+    }).then(r => {
+        let lines = r.message || [];
+        if (!lines.length || frm.doc.docstatus !== 0) {
+            return;
+        }
+
+        let currency = frm.doc.currency;
+        let rows = lines.map(line => `
+            <tr>
+                <td>${frappe.utils.escape_html(line.account)}</td>
+                <td>${frappe.utils.escape_html(line.budget_against || "")}: ${frappe.utils.escape_html(line.budget_against_value || __("Any"))}</td>
+                <td class="text-right">${format_currency(line.budget, currency)}</td>
+                <td class="text-right">${format_currency(line.used, currency)}</td>
+                <td class="text-right">${format_currency(line.requested, currency)}</td>
+                <td class="text-right ${line.exceeded ? "text-danger" : "text-success"}">
+                    <b>${format_currency(line.remaining, currency)}</b>
+                </td>
+            </tr>`).join("");
+
+        if (frm.__budget_headroom_section) {
+            frm.__budget_headroom_section.remove();
+        }
+        frm.__budget_headroom_section = frm.dashboard.add_section(`
+            <table class="table table-bordered table-condensed">
+                <thead><tr>
+                    <th>${__("Account")}</th>
+                    <th>${__("Budget Against")}</th>
+                    <th class="text-right">${__("Budget")}</th>
+                    <th class="text-right">${__("Used")}</th>
+                    <th class="text-right">${__("This Document")}</th>
+                    <th class="text-right">${__("Remaining")}</th>
+                </tr></thead>
+                <tbody>${rows}</tbody>
+            </table>`, __("Capital Budget Headroom"));
+        frm.dashboard.show();
+    });
+};
+
+cgcdferp.budget.setup_headroom = function(doctype, child_doctype) {
+    let refresh = frm => cgcdferp.budget.refresh_headroom(frm);
+
+    frappe.ui.form.on(doctype, {
+        refresh: refresh,
+        company: refresh,
+        cost_center: refresh,
+        project: refresh,
+        department: refresh,
+        material_request_type: refresh
+    });
+
+    let child_events = { items_remove: refresh };
+    cgcdferp.budget.headroom_fields.forEach(f => { child_events[f] = refresh; });
+    frappe.ui.form.on(child_doctype, child_events);
+};
@@ -0,0 +1,52 @@
+frappe.provide("cgcdferp.budget");
+
+cgcdferp.budget.get_summary = function(frm) {
+    let summary = frm.doc.custom_budget_summary;
+    if (typeof summary === "string") {
+        summary = summary ? JSON.parse(summary) : null;
+    }
+    return summary && (summary.accounts || []).length ? summary : null;
+};
+
+cgcdferp.budget.get_summary_html = function(summary) {
+    return (summary.accounts || []).map(line => `
+        <div style="margin: 15px 0; padding: 10px; border: 1px solid var(--border-color); border-radius: 5px;">
+            <b>${__("Account")}: ${frappe.utils.escape_html(line.account)}</b><br><br>
+            ${__("Budget")}: ${format_currency(line.budget, summary.currency)}<br>
+            ${__("Used")}: ${format_currency(line.used, summary.currency)}<br>
+            <span class="${line.remaining < 0 ? "text-danger" : "text-success"}" style="font-weight: bold;">
+                ${__("Remaining")}: ${format_currency(line.remaining, summary.currency)}
+            </span>
+        </div>`).join("");
+};
+
+cgcdferp.budget.setup_summary = function(doctype) {
+    frappe.ui.form.on(doctype, {
+        on_submit: function(frm) {
+            // the summary is computed during submit and only rendered here
+            let summary = cgcdferp.budget.get_summary(frm);
+            if (summary) {
+                frappe.msgprint({
+                    title: __("Budget Status Update"),
+                    indicator: "blue",
+                    message: `<h4>${__("Capital Budget Summary After This {0}", [__(frm.doctype)])}:</h4>`
+                        + cgcdferp.budget.get_summary_html(summary)
+                });
+            }
+        },
+        refresh: function(frm) {
+            if (frm.__budget_summary_section) {
+                frm.__budget_summary_section.remove();
+                frm.__budget_summary_section = null;
+            }
+
+            let summary = frm.doc.docstatus === 1 && cgcdferp.budget.get_summary(frm);
+            if (summary) {
+                frm.__budget_summary_section = frm.dashboard.add_section(
+                    cgcdferp.budget.get_summary_html(summary), __("Capital Budget Summary")
+                );
+                frm.dashboard.show();
+            }
+        }
+    });
+};
@@ -0,0 +1 @@
+cgcdferp.budget.setup_summary("Purchase Receipt");